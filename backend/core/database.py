@@ -0,0 +1,29 @@
+import sqlite3
+import threading
+
+
+class Database:
+    PRAGMAS = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA cache_size=-16000',
+        'PRAGMA mmap_size=268435456',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA busy_timeout=5000',
+    ]
+    local = threading.local()
+
+    @staticmethod
+    def connect(path):
+        connections = getattr(Database.local, 'connections', None)
+        if connections is None:
+            connections = {}
+            Database.local.connections = connections
+        conn = connections.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path)
+            for pragma in Database.PRAGMAS:
+                conn.execute(pragma)
+            connections[path] = conn
+        return conn
+
@@ -2,6 +2,7 @@ import os
 import re
 import uuid
 import sqlite3
+from backend.core.database import Database
 
 
 class Document:
@@ -9,17 +10,20 @@ class Document:
     DOCUMENTS_PATH = os.path.join(BASE_DIR, 'data', 'documents')
     DB_PATH = os.path.join(BASE_DIR, 'data', 'documents.db')
 
-    def __init__(self, doc_id, name, path):
+    def __init__(self, doc_id, name, path, keywords=None):
         self.id = doc_id
         self.name = name
         self.path = path
         self.keywords = []
-        self.load_keywords()
+        if keywords is None:
+            self.load_keywords()
+        else:
+            self.keywords = keywords
 
     @staticmethod
     def init_storage():
         os.makedirs(Document.DOCUMENTS_PATH, exist_ok=True)
-        conn = sqlite3.connect(Document.DB_PATH)
+        conn = Database.connect(Document.DB_PATH)
         conn.execute('''CREATE TABLE IF NOT EXISTS documents (
             id TEXT PRIMARY KEY,
             name TEXT NOT NULL,
@@ -30,73 +34,138 @@ class Document:
             keyword TEXT NOT NULL,
             FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE
         )''')
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(keywords)').fetchall()]
+        if 'stem' not in columns:
+            conn.execute('ALTER TABLE keywords ADD COLUMN stem TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS documents_name ON documents (name)')
+        conn.execute('CREATE INDEX IF NOT EXISTS keywords_document_id ON keywords (document_id)')
+        conn.execute('CREATE INDEX IF NOT EXISTS keywords_stem ON keywords (stem)')
         conn.commit()
-        conn.close()
+        
+        from backend.core.text_preprocess import TextPreprocessor
+        preprocessor = TextPreprocessor.get_instance()
+        rows = conn.execute('SELECT rowid, keyword FROM keywords WHERE stem IS NULL').fetchall()
+        if rows:
+            with conn:
+                conn.executemany('UPDATE keywords SET stem = ? WHERE rowid = ?',
+                                 [(preprocessor.preprocess(keyword), rowid) for rowid, keyword in rows])
 
     @staticmethod
     def get_all():
         Document.init_storage()
-        conn = sqlite3.connect(Document.DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = Database.connect(Document.DB_PATH)
+        cur = conn.cursor()
+        cur.execute('SELECT d.id, d.name, d.file_path, k.keyword FROM documents d '
+                    'LEFT JOIN keywords k ON k.document_id = d.id ORDER BY d.name, k.rowid')
+        return Document.from_joined_rows(cur.fetchall())
+
+    @staticmethod
+    def get_many(names):
+        names = list(names)
+        if not names:
+            return []
+        conn = Database.connect(Document.DB_PATH)
         cur = conn.cursor()
-        cur.execute('SELECT id, name, file_path FROM documents ORDER BY name')
-        rows = cur.fetchall()
+        rows = []
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ','.join('?' for _ in chunk)
+            cur.execute(f'SELECT d.id, d.name, d.file_path, k.keyword FROM documents d '
+                        f'LEFT JOIN keywords k ON k.document_id = d.id WHERE d.name IN ({placeholders}) '
+                        f'ORDER BY d.name, k.rowid', chunk)
+            rows.extend(cur.fetchall())
+        return Document.from_joined_rows(rows)
+
+    @staticmethod
+    def from_joined_rows(rows):
         docs = []
-        for row in rows:
-            doc = Document(row['id'], row['name'], row['file_path'])
-            docs.append(doc)
-        conn.close()
+        by_id = {}
+        for doc_id, name, file_path, keyword in rows:
+            doc = by_id.get(doc_id)
+            if doc is None:
+                doc = Document(doc_id, name, file_path, [])
+                by_id[doc_id] = doc
+                docs.append(doc)
+            if keyword is not None:
+                doc.keywords.append(keyword)
         return docs
 
     @staticmethod
     def get_by_id(doc_id):
-        conn = sqlite3.connect(Document.DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = Database.connect(Document.DB_PATH)
         cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
         cur.execute('SELECT id, name, file_path FROM documents WHERE id = ?', (doc_id,))
         row = cur.fetchone()
-        conn.close()
         if row:
             return Document(row['id'], row['name'], row['file_path'])
         return None
 
     @staticmethod
     def get_by_name(name):
-        conn = sqlite3.connect(Document.DB_PATH)
-        conn.row_factory = sqlite3.Row
+        conn = Database.connect(Document.DB_PATH)
         cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
         cur.execute('SELECT id, name, file_path FROM documents WHERE name = ?', (name,))
         row = cur.fetchone()
-        conn.close()
         if row:
             return Document(row['id'], row['name'], row['file_path'])
         return None
 
     def load_keywords(self):
-        conn = sqlite3.connect(Document.DB_PATH)
+        conn = Database.connect(Document.DB_PATH)
         cur = conn.cursor()
         cur.execute('SELECT keyword FROM keywords WHERE document_id = ?', (self.id,))
         self.keywords = [row[0] for row in cur.fetchall()]
-        conn.close()
 
     def save_to_db(self, keywords):
-        conn = sqlite3.connect(Document.DB_PATH)
-        cur = conn.cursor()
-        cur.execute('INSERT OR REPLACE INTO documents (id, name, file_path) VALUES (?, ?, ?)',
-                    (self.id, self.name, self.path))
-        cur.execute('DELETE FROM keywords WHERE document_id = ?', (self.id,))
-        for kw in keywords:
-            cur.execute('INSERT INTO keywords (document_id, keyword) VALUES (?, ?)', (self.id, kw))
-        conn.commit()
-        conn.close()
+        from backend.core.text_preprocess import TextPreprocessor
+        preprocessor = TextPreprocessor.get_instance()
+        conn = Database.connect(Document.DB_PATH)
+        with conn:
+            cur = conn.cursor()
+            cur.execute('INSERT OR REPLACE INTO documents (id, name, file_path) VALUES (?, ?, ?)',
+                        (self.id, self.name, self.path))
+            cur.execute('DELETE FROM keywords WHERE document_id = ?', (self.id,))
+            for kw in keywords:
+                cur.execute('INSERT INTO keywords (document_id, keyword, stem) VALUES (?, ?, ?)',
+                            (self.id, kw, preprocessor.preprocess(kw)))
         self.keywords = keywords
 
-    def delete_from_db(self):
-        conn = sqlite3.connect(Document.DB_PATH)
+    @staticmethod
+    def get_names_by_keyword_stems(stems):
+        if not stems:
+            return {}
+        Document.init_storage()
+        conn = Database.connect(Document.DB_PATH)
         cur = conn.cursor()
-        cur.execute('DELETE FROM documents WHERE id = ?', (self.id,))
-        conn.commit()
-        conn.close()
+        placeholders = ','.join('?' for _ in stems)
+        cur.execute(f'SELECT k.stem, d.name FROM keywords k JOIN documents d ON d.id = k.document_id '
+                    f'WHERE k.stem IN ({placeholders})', list(stems))
+        names = {}
+        for stem, name in cur.fetchall():
+            names.setdefault(stem, set()).add(name)
+        return names
+
+    @staticmethod
+    def get_words_by_stems(stems):
+        if not stems:
+            return {}
+        Document.init_storage()
+        conn = Database.connect(Document.DB_PATH)
+        cur = conn.cursor()
+        placeholders = ','.join('?' for _ in stems)
+        cur.execute(f'SELECT stem, keyword FROM keywords WHERE stem IN ({placeholders})', list(stems))
+        counts = {}
+        for stem, keyword in cur.fetchall():
+            words = counts.setdefault(stem, {})
+            words[keyword.lower()] = words.get(keyword.lower(), 0) + 1
+        return {stem: max(words, key=words.get) for stem, words in counts.items()}
+
+    def delete_from_db(self):
+        conn = Database.connect(Document.DB_PATH)
+        with conn:
+            conn.execute('DELETE FROM documents WHERE id = ?', (self.id,))
 
     def get_text(self):
         if not os.path.exists(self.path):
@@ -104,11 +173,9 @@ class Document:
             if os.path.exists(alt):
                 self.path = alt
                 try:
-                    conn = sqlite3.connect(Document.DB_PATH)
-                    cur = conn.cursor()
-                    cur.execute('UPDATE documents SET file_path = ? WHERE id = ?', (self.path, self.id))
-                    conn.commit()
-                    conn.close()
+                    conn = Database.connect(Document.DB_PATH)
+                    with conn:
+                        conn.execute('UPDATE documents SET file_path = ? WHERE id = ?', (self.path, self.id))
                 except Exception:
                     pass
             else:
@@ -118,16 +185,16 @@ class Document:
 
     def get_preprocessed_text(self):
         from backend.core.text_preprocess import TextPreprocessor
-        preprocessor = TextPreprocessor()
+        preprocessor = TextPreprocessor.get_instance()
         return preprocessor.preprocess(self.get_text())
 
     def matches_filters(self, filters):
         if not filters:
             return True
         from backend.core.text_preprocess import TextPreprocessor
-        preprocessor = TextPreprocessor()
-        doc_text = self.get_preprocessed_text()
-        doc_words = set(doc_text.split())
+        from backend.core.index import Index
+        preprocessor = TextPreprocessor.get_instance()
+        doc_words = set(Index().get_document_terms(self.name))
         kw_words = set(preprocessor.preprocess(kw) for kw in self.keywords)
         doc_vocab = doc_words | kw_words
         for f in filters:
@@ -137,7 +204,7 @@ class Document:
         return True
 
     @staticmethod
-    def create_new(name, text):
+    def create_new(name, text, progress=None):
         if not name or not name.strip():
             raise ValueError("Имя документа не может быть пустым")
         if not text or not text.strip():
@@ -153,28 +220,35 @@ class Document:
             f.write(text)
         
         doc = Document(str(uuid.uuid4()), name, path)
-        doc.add_to_index()
+        doc.add_to_index(progress)
         return doc
 
-    def add_to_index(self):
+    def add_to_index(self, progress=None):
         from backend.core.index import Index
+        from backend.core.search import SearchEngine
+        from backend.core.segments import SegmentMerger
         
         index = Index()
         original_text = self.get_text()
         keywords = index.extract_keywords(original_text, top_n=7)
         
         self.save_to_db(keywords)
-        index.build_index()
+        index.update_document(self.name, original_text, progress)
+        SearchEngine().update_similar_documents(self.name)
+        SegmentMerger(index).merge_in_background()
 
     def delete(self):
         from backend.core.index import Index
+        from backend.core.segments import SegmentMerger
         self.delete_from_db()
         if os.path.exists(self.path):
             os.remove(self.path)
-        Index().build_index()
+        index = Index()
+        index.remove_document(self.name)
+        SegmentMerger(index).merge_in_background()
 
     @staticmethod
-    def update_text(doc_id, new_text):
+    def update_text(doc_id, new_text, progress=None):
         if not new_text or not new_text.strip():
             raise ValueError("Текст документа не может быть пустым")
         
@@ -190,16 +264,14 @@ class Document:
             os.makedirs(Document.DOCUMENTS_PATH, exist_ok=True)
             doc.path = path
             try:
-                conn = sqlite3.connect(Document.DB_PATH)
-                cur = conn.cursor()
-                cur.execute('UPDATE documents SET file_path = ? WHERE id = ?', (doc.path, doc.id))
-                conn.commit()
-                conn.close()
+                conn = Database.connect(Document.DB_PATH)
+                with conn:
+                    conn.execute('UPDATE documents SET file_path = ? WHERE id = ?', (doc.path, doc.id))
             except Exception:
                 pass
         with open(path, 'w', encoding='utf-8') as f:
             f.write(new_text)
-        doc.add_to_index()
+        doc.add_to_index(progress)
 
     @staticmethod
     def delete_document(doc_id_or_name):
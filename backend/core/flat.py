@@ -0,0 +1,124 @@
+import os
+import sys
+import mmap
+import struct
+import tempfile
+from array import array
+
+
+class FlatIndex:
+    MAGIC = b'TFX1'
+    HEADER = struct.Struct('<4sIQQQQ')
+    ALIGNMENT = 8
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.mm)
+        magic, positions, base_version, term_count, postings_count, positions_count = self.HEADER.unpack_from(view)
+        if magic != self.MAGIC:
+            raise ValueError(f"Неверный формат файла индекса: {path}")
+        self.base_version = base_version
+        self.has_positions = bool(positions)
+        self.term_count = term_count
+        
+        offset = self.HEADER.size
+        self.term_offsets, offset = self.section(view, offset, 'Q', term_count + 1)
+        self.terms, offset = self.section(view, offset, 'B', self.term_offsets[term_count])
+        self.postings_offsets, offset = self.section(view, offset, 'Q', term_count + 1)
+        self.doc_ids, offset = self.section(view, offset, 'I', postings_count)
+        self.tfs, offset = self.section(view, offset, 'I', postings_count)
+        self.positions_offsets, offset = self.section(view, offset, 'Q', term_count + 1 if positions else 0)
+        self.positions, offset = self.section(view, offset, 'I', positions_count)
+
+    def section(self, view, offset, typecode, count):
+        size = count * struct.calcsize(typecode)
+        return view[offset:offset + size].cast(typecode), self.align(offset + size)
+
+    @staticmethod
+    def align(offset):
+        return (offset + FlatIndex.ALIGNMENT - 1) // FlatIndex.ALIGNMENT * FlatIndex.ALIGNMENT
+
+    @staticmethod
+    def open(path, base_version):
+        if sys.byteorder != 'little' or not os.path.exists(path):
+            return None
+        try:
+            flat = FlatIndex(path)
+        except (OSError, ValueError, struct.error):
+            return None
+        if flat.base_version != base_version:
+            return None
+        return flat
+
+    def find(self, term):
+        key = term.encode('utf-8')
+        low = 0
+        high = self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            current = self.terms[self.term_offsets[middle]:self.term_offsets[middle + 1]].tobytes()
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def get_postings(self, term):
+        number = self.find(term)
+        if number is None:
+            return None
+        start = self.postings_offsets[number]
+        end = self.postings_offsets[number + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+    def get_positions(self, term):
+        if not self.has_positions:
+            return None
+        number = self.find(term)
+        if number is None:
+            return None
+        start = self.postings_offsets[number]
+        end = self.postings_offsets[number + 1]
+        deltas = self.positions[self.positions_offsets[number]:self.positions_offsets[number + 1]]
+        return self.doc_ids[start:end], self.tfs[start:end], deltas
+
+    @staticmethod
+    def write(path, base_version, rows, positions):
+        term_offsets = array('Q', [0])
+        terms = bytearray()
+        postings_offsets = array('Q', [0])
+        doc_ids = array('I')
+        tfs = array('I')
+        positions_offsets = array('Q', [0])
+        all_positions = array('I')
+        for term, term_doc_ids, term_tfs, deltas in rows:
+            terms += term.encode('utf-8')
+            term_offsets.append(len(terms))
+            doc_ids.extend(term_doc_ids)
+            tfs.fromlist(list(term_tfs))
+            postings_offsets.append(len(doc_ids))
+            if positions:
+                all_positions.fromlist(list(deltas))
+                positions_offsets.append(len(all_positions))
+        
+        sections = [term_offsets, array('B', terms), postings_offsets, doc_ids, tfs]
+        if positions:
+            sections.extend([positions_offsets, all_positions])
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(FlatIndex.HEADER.pack(FlatIndex.MAGIC, int(positions), base_version, len(term_offsets) - 1,
+                                          len(doc_ids), len(all_positions)))
+            for section in sections:
+                f.write(b'\0' * (FlatIndex.align(f.tell()) - f.tell()))
+                if sys.byteorder == 'big':
+                    section.byteswap()
+                f.write(section.tobytes())
+        try:
+            os.replace(temp_path, path)
+        except OSError:
+            os.remove(temp_path)
+            return False
+        return True
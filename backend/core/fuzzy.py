@@ -0,0 +1,69 @@
+class FuzzyTermIndex:
+    def __init__(self, index, max_distance=1):
+        self.index = index
+        self.max_distance = max_distance
+        self.generation = None
+        self.deletes = {}
+        self.terms = set()
+
+    def refresh(self):
+        self.index.load_stats_once()
+        if self.generation == self.index.stats_generation:
+            return
+        terms = set(self.index.sorted_terms)
+        for term in self.terms - terms:
+            for variant in self.get_deletes(term):
+                variant_terms = self.deletes[variant]
+                variant_terms.discard(term)
+                if not variant_terms:
+                    del self.deletes[variant]
+        for term in terms - self.terms:
+            for variant in self.get_deletes(term):
+                self.deletes.setdefault(variant, set()).add(term)
+        self.terms = terms
+        self.generation = self.index.stats_generation
+
+    def get_deletes(self, word):
+        variants = {word}
+        edge = {word}
+        for _ in range(self.max_distance):
+            next_edge = set()
+            for variant in edge:
+                if len(variant) <= 1:
+                    continue
+                for i in range(len(variant)):
+                    next_edge.add(variant[:i] + variant[i + 1:])
+            variants.update(next_edge)
+            edge = next_edge
+        return variants
+
+    def lookup(self, word, limit=None):
+        self.refresh()
+        candidates = set()
+        for variant in self.get_deletes(word):
+            candidates.update(self.deletes.get(variant, ()))
+        matches = []
+        for term in candidates:
+            distance = self.edit_distance(word, term)
+            if distance <= self.max_distance:
+                matches.append((term, distance))
+        matches.sort(key=lambda m: (m[1], -self.index.term_dfs.get(m[0], 0), m[0]))
+        return matches[:limit] if limit else matches
+
+    def edit_distance(self, a, b):
+        if abs(len(a) - len(b)) > self.max_distance:
+            return self.max_distance + 1
+        previous_previous = None
+        previous = list(range(len(b) + 1))
+        for i in range(1, len(a) + 1):
+            current = [i] + [0] * len(b)
+            for j in range(1, len(b) + 1):
+                cost = 0 if a[i - 1] == b[j - 1] else 1
+                current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+                if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                    current[j] = min(current[j], previous_previous[j - 2] + 1)
+            if min(current) > self.max_distance:
+                return self.max_distance + 1
+            previous_previous = previous
+            previous = current
+        return previous[len(b)]
@@ -1,110 +1,614 @@
 import os
 import re
 import math
-import sqlite3
+import heapq
+import hashlib
 import pickle
+import tempfile
+import multiprocessing
+from array import array
+from bisect import bisect_left
 from collections import Counter, defaultdict
+from functools import partial
+from backend.core.postings import PostingsCodec, PostingsBuffer
+from backend.core.flat import FlatIndex
+from backend.core.database import Database
 
 
 class Index:
-    def __init__(self):
+    POSTINGS_FORMAT = 2
+    SHARD_SIZE = 64
+    BATCH_SIZE = 1000
+    REBUILD_RATIO = 0.5
+
+    def __init__(self, data_path=None, db_path=None):
         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        self.data_path = os.path.join(base_dir, 'data', 'documents')
-        self.db_path = os.path.join(base_dir, 'backend', 'core', 'index', 'inverted_index.db')
+        self.data_path = data_path or os.path.join(base_dir, 'data', 'documents')
+        self.db_path = db_path or os.path.join(base_dir, 'backend', 'core', 'index', 'inverted_index.db')
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.flat_path = os.path.splitext(self.db_path)[0] + '.bin'
+        self.flat = None
+        self.flat_mtime = None
+        self.base_version = None
+        self.codec = PostingsCodec()
+        self.stats_generation = None
+        self.total_docs = 0
+        self.term_dfs = {}
+        self.term_max_weights = {}
+        self.term_max_tfs = {}
+        self.term_min_lengths = {}
+        self.total_length = 0
+        self.doc_lengths = {}
+        self.sorted_terms = []
+        self.doc_ids = {}
+        self.doc_names = {}
+        self.doc_norms = {}
+        self.tombstones = set()
         self.init_db()
 
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
-        cur.execute('CREATE TABLE IF NOT EXISTS index_table (term TEXT PRIMARY KEY, postings BLOB)')
-        cur.execute('CREATE TABLE IF NOT EXISTS doc_meta (filename TEXT PRIMARY KEY, norm REAL)')
+        cur.execute('CREATE TABLE IF NOT EXISTS index_table (term TEXT PRIMARY KEY, postings BLOB, df INTEGER, '
+                    'max_weight REAL)')
+        cur.execute('CREATE TABLE IF NOT EXISTS doc_meta (filename TEXT PRIMARY KEY, norm REAL, terms BLOB)')
         cur.execute('CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value INTEGER)')
+        cur.execute('CREATE TABLE IF NOT EXISTS similar_docs (filename TEXT, similar TEXT, score REAL)')
+        cur.execute('CREATE TABLE IF NOT EXISTS positions_table (term TEXT PRIMARY KEY, positions BLOB)')
+        cur.execute('CREATE TABLE IF NOT EXISTS segments (segment INTEGER PRIMARY KEY, docs INTEGER)')
+        cur.execute('CREATE TABLE IF NOT EXISTS segment_postings (segment INTEGER, term TEXT, postings BLOB, '
+                    'positions BLOB, PRIMARY KEY (term, segment))')
+        cur.execute('CREATE TABLE IF NOT EXISTS tombstones (doc_id INTEGER PRIMARY KEY, segment INTEGER)')
+        self.add_missing_column(cur, 'index_table', 'df', 'INTEGER')
+        self.add_missing_column(cur, 'index_table', 'max_weight', 'REAL')
+        self.add_missing_column(cur, 'doc_meta', 'terms', 'BLOB')
+        self.add_missing_column(cur, 'doc_meta', 'doc_id', 'INTEGER')
+        self.add_missing_column(cur, 'doc_meta', 'length', 'INTEGER')
+        self.add_missing_column(cur, 'index_table', 'max_tf', 'INTEGER')
+        self.add_missing_column(cur, 'index_table', 'min_length', 'INTEGER')
+        self.add_missing_column(cur, 'doc_meta', 'segment', 'INTEGER DEFAULT 0')
+        self.add_missing_column(cur, 'doc_meta', 'size', 'INTEGER')
+        self.add_missing_column(cur, 'doc_meta', 'mtime', 'INTEGER')
+        self.add_missing_column(cur, 'doc_meta', 'fingerprint', 'TEXT')
+        cur.execute('CREATE INDEX IF NOT EXISTS doc_meta_doc_id ON doc_meta (doc_id)')
+        cur.execute('CREATE INDEX IF NOT EXISTS similar_docs_filename ON similar_docs (filename)')
+        cur.execute('CREATE INDEX IF NOT EXISTS similar_docs_similar ON similar_docs (similar)')
+        cur.execute('CREATE INDEX IF NOT EXISTS segment_postings_segment ON segment_postings (segment)')
         conn.commit()
-        conn.close()
 
-    def tokenize(self, text):
+    def add_missing_column(self, cur, table, column, column_type):
+        cur.execute(f'PRAGMA table_info({table})')
+        columns = [row[1] for row in cur.fetchall()]
+        if column not in columns:
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    @staticmethod
+    def tokenize(text):
         from backend.core.text_preprocess import TextPreprocessor
-        preprocessor = TextPreprocessor()
-        return re.findall(r'\w+', preprocessor.preprocess(text))
+        preprocessor = TextPreprocessor.get_instance()
+        return preprocessor.preprocess(text).split()
+
+    @staticmethod
+    def count_terms(data_path, positions, files):
+        doc_freqs = {}
+        doc_positions = {}
+        doc_states = {}
+        for filename in files:
+            text, doc_states[filename[:-4]] = Index.read_file(os.path.join(data_path, filename))
+            tokens = Index.tokenize(text)
+            doc_freqs[filename[:-4]] = Counter(tokens)
+            if positions:
+                doc_positions[filename[:-4]] = Index.term_positions(tokens)
+        return doc_freqs, doc_positions, doc_states
+
+    @staticmethod
+    def read_file(path):
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        fingerprint = Index.new_fingerprint()
+        fingerprint.update(data)
+        return data.decode('utf-8'), (stat.st_size, stat.st_mtime_ns, fingerprint.hexdigest())
 
-    def build_index(self):
+    @staticmethod
+    def new_fingerprint():
+        return hashlib.blake2b(digest_size=16)
+
+    @staticmethod
+    def term_positions(tokens):
+        positions = defaultdict(list)
+        for position, term in enumerate(tokens):
+            positions[term].append(position)
+        return positions
+
+    def build_index(self, workers=1, progress=None, positions=None, memory_budget=None):
+        if positions is None:
+            positions = self.positions_enabled()
         os.makedirs(self.data_path, exist_ok=True)
-        files = [f for f in os.listdir(self.data_path) if f.endswith('.txt')]
+        files = sorted((f for f in os.listdir(self.data_path) if f.endswith('.txt')), key=lambda f: f[:-4])
+        shards = [files[i:i + self.SHARD_SIZE] for i in range(0, len(files), self.SHARD_SIZE)]
+        if memory_budget:
+            self.build_index_external(shards, len(files), workers, progress, positions, memory_budget)
+            return
         
-        term_docs = defaultdict(set)
         doc_freqs = {}
+        doc_positions = {}
+        doc_states = {}
+        for partial_freqs, partial_positions, partial_states in self.count_shards(shards, workers, positions):
+            doc_freqs.update(partial_freqs)
+            doc_positions.update(partial_positions)
+            doc_states.update(partial_states)
+            if progress:
+                progress(len(doc_freqs), len(files))
         
-        for filename in files:
-            path = os.path.join(self.data_path, filename)
-            with open(path, 'r', encoding='utf-8') as f:
-                tokens = self.tokenize(f.read())
-            freqs = Counter(tokens)
-            doc_name = filename[:-4]
-            doc_freqs[doc_name] = freqs
-            for term in freqs:
+        doc_names = sorted(doc_freqs)
+        term_docs = defaultdict(set)
+        for doc_name in doc_names:
+            for term in doc_freqs[doc_name]:
                 term_docs[term].add(doc_name)
         
         total = len(doc_freqs)
-        if total == 0:
-            conn = sqlite3.connect(self.db_path)
+        conn = Database.connect(self.db_path)
+        with conn:
             cur = conn.cursor()
-            cur.execute('DELETE FROM index_table')
-            cur.execute('DELETE FROM doc_meta')
-            cur.execute('INSERT OR REPLACE INTO metadata VALUES ("total_docs", ?)', (0,))
-            conn.commit()
-            conn.close()
+            self.clear_index(cur)
+            
+            doc_ids = {}
+            norms = {}
+            lengths = {}
+            for doc_id, doc_name in enumerate(doc_names):
+                freqs = doc_freqs[doc_name]
+                norm = 0
+                for term, tf in freqs.items():
+                    idf = self.idf_from_df(len(term_docs[term]), total)
+                    tfidf = (1 + math.log(tf)) * idf
+                    norm += tfidf * tfidf
+                norm = math.sqrt(norm)
+                doc_ids[doc_name] = doc_id
+                norms[doc_name] = norm
+                lengths[doc_name] = sum(freqs.values())
+                cur.execute('INSERT INTO doc_meta (filename, norm, terms, doc_id, length, size, mtime, fingerprint) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (doc_name, norm, pickle.dumps(dict(freqs)), doc_id, lengths[doc_name])
+                            + doc_states[doc_name])
+            
+            for term, docs in term_docs.items():
+                ids = sorted(doc_ids[doc] for doc in docs)
+                tfs = []
+                max_weight = 0
+                for doc_id in ids:
+                    doc_name = doc_names[doc_id]
+                    tf = doc_freqs[doc_name][term]
+                    tfs.append(tf)
+                    if norms[doc_name] > 0:
+                        max_weight = max(max_weight, (1 + math.log(tf)) / norms[doc_name])
+                cur.execute('INSERT INTO index_table (term, postings, df, max_weight, max_tf, min_length) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            (term, self.codec.encode(ids, tfs), len(ids), max_weight, max(tfs),
+                             min(lengths[doc_names[doc_id]] for doc_id in ids)))
+                if positions:
+                    position_lists = [doc_positions[doc_names[doc_id]][term] for doc_id in ids]
+                    cur.execute('INSERT INTO positions_table VALUES (?, ?)',
+                                (term, self.codec.encode_positions(position_lists)))
+            
+            self.write_metadata(cur, total, sum(lengths.values()), positions)
+
+    def count_shards(self, shards, workers, positions):
+        count_terms = partial(Index.count_terms, self.data_path, positions)
+        if workers > 1 and len(shards) > 1:
+            with multiprocessing.Pool(workers) as pool:
+                yield from pool.imap(count_terms, shards)
+        else:
+            for shard in shards:
+                yield count_terms(shard)
+
+    def build_index_external(self, shards, total_files, workers, progress, positions, memory_budget):
+        buffer = PostingsBuffer(memory_budget)
+        dfs = Counter()
+        total = 0
+        with tempfile.TemporaryFile() as records:
+            for partial_freqs, partial_positions, partial_states in self.count_shards(shards, workers, positions):
+                for doc_name in sorted(partial_freqs):
+                    freqs = partial_freqs[doc_name]
+                    buffer.add(total, freqs, partial_positions[doc_name] if positions else None)
+                    dfs.update(freqs.keys())
+                    pickle.dump((doc_name, dict(freqs), partial_states[doc_name]), records, pickle.HIGHEST_PROTOCOL)
+                    total += 1
+                if progress:
+                    progress(total, total_files)
+            records.seek(0)
+            
+            conn = Database.connect(self.db_path)
+            with conn:
+                cur = conn.cursor()
+                self.clear_index(cur)
+                
+                idfs = {term: self.idf_from_df(df, total) for term, df in dfs.items()}
+                norms = array('d')
+                lengths = array('I')
+                rows = []
+                for doc_id, (doc_name, freqs, state) in enumerate(PostingsBuffer.read_records(records)):
+                    weights = [(1 + math.log(tf)) * idfs[term] for term, tf in freqs.items()]
+                    norm = math.sqrt(sum(w * w for w in weights))
+                    norms.append(norm)
+                    lengths.append(sum(freqs.values()))
+                    rows.append((doc_name, norm, pickle.dumps(freqs), doc_id, lengths[doc_id]) + state)
+                    if len(rows) >= self.BATCH_SIZE:
+                        self.write_doc_meta(cur, rows)
+                        rows = []
+                self.write_doc_meta(cur, rows)
+                self.write_merged_postings(cur, buffer.merge(), norms, lengths, positions)
+                self.write_metadata(cur, total, sum(lengths), positions)
+
+    def clear_index(self, cur):
+        cur.execute('DELETE FROM index_table')
+        cur.execute('DELETE FROM doc_meta')
+        cur.execute('DELETE FROM similar_docs')
+        cur.execute('DELETE FROM positions_table')
+        cur.execute('DELETE FROM segment_postings')
+        cur.execute('DELETE FROM segments')
+        cur.execute('DELETE FROM tombstones')
+
+    def write_doc_meta(self, cur, rows):
+        cur.executemany('INSERT INTO doc_meta (filename, norm, terms, doc_id, length, size, mtime, fingerprint) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def write_merged_postings(self, cur, merged, norms, lengths, positions):
+        postings_rows = []
+        positions_rows = []
+        for term, (ids, tfs, position_lists) in merged:
+            max_weight = 0
+            for doc_id, tf in zip(ids, tfs):
+                if norms[doc_id] > 0:
+                    max_weight = max(max_weight, (1 + math.log(tf)) / norms[doc_id])
+            postings_rows.append((term, self.codec.encode(ids, tfs), len(ids), max_weight, max(tfs),
+                                  min(lengths[doc_id] for doc_id in ids)))
+            if positions:
+                positions_rows.append((term, self.codec.encode_positions(position_lists)))
+            if len(postings_rows) >= self.BATCH_SIZE:
+                self.write_postings(cur, postings_rows, positions_rows)
+                postings_rows = []
+                positions_rows = []
+        self.write_postings(cur, postings_rows, positions_rows)
+
+    def write_postings(self, cur, postings_rows, positions_rows):
+        cur.executemany('INSERT INTO index_table (term, postings, df, max_weight, max_tf, min_length) '
+                        'VALUES (?, ?, ?, ?, ?, ?)', postings_rows)
+        cur.executemany('INSERT INTO positions_table VALUES (?, ?)', positions_rows)
+
+    def write_metadata(self, cur, total, total_length, positions):
+        self.set_metadata(cur, 'total_docs', total)
+        self.set_metadata(cur, 'total_length', total_length)
+        self.set_metadata(cur, 'next_doc_id', total)
+        self.set_metadata(cur, 'postings_format', self.POSTINGS_FORMAT)
+        self.set_metadata(cur, 'positions', int(positions))
+        self.increase_base_version(cur)
+        self.increase_generation(cur)
+            
+    def update_document(self, doc_name, text, progress=None):
+        if self.needs_full_build():
+            self.build_index(progress=progress)
             return
-        
-        conn = sqlite3.connect(self.db_path)
+        tokens = self.tokenize(text)
+        positions = self.term_positions(tokens) if self.positions_enabled() else None
+        path = os.path.join(self.data_path, doc_name + '.txt')
+        state = self.read_file(path)[1] if os.path.exists(path) else None
+        conn = Database.connect(self.db_path)
+        with conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            self.remove_postings(cur, doc_name)
+            self.add_postings(cur, doc_name, Counter(tokens), positions, state)
+            self.invalidate_similar(cur, doc_name)
+            self.increase_generation(cur)
+
+    def remove_document(self, doc_name):
+        if self.needs_full_build():
+            self.build_index()
+            return
+        conn = Database.connect(self.db_path)
+        with conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            self.remove_postings(cur, doc_name)
+            self.invalidate_similar(cur, doc_name)
+            self.increase_generation(cur)
+
+    def sync_index(self, workers=1, progress=None, positions=None, memory_budget=None):
+        os.makedirs(self.data_path, exist_ok=True)
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
+        cur.execute('SELECT filename, size, mtime, fingerprint FROM doc_meta')
+        stored = {row[0]: row[1:] for row in cur.fetchall()}
+        names = set()
+        changed = []
+        with os.scandir(self.data_path) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.txt') or not entry.is_file():
+                    continue
+                doc_name = entry.name[:-4]
+                names.add(doc_name)
+                stat = entry.stat()
+                if doc_name not in stored or stored[doc_name][:2] != (stat.st_size, stat.st_mtime_ns):
+                    changed.append(doc_name)
+        changed.sort()
+        added = [doc_name for doc_name in changed if doc_name not in stored]
+        removed = sorted(set(stored) - names)
         
-        for term, docs in term_docs.items():
-            df = len(docs)
-            idf = math.log((total + 1) / (df + 1)) + 1
-            postings = [(doc, doc_freqs[doc][term]) for doc in docs]
-            cur.execute('INSERT OR REPLACE INTO index_table VALUES (?, ?)', (term, pickle.dumps(postings)))
+        enabled = self.positions_enabled()
+        if positions is None:
+            positions = enabled
+        if (positions != enabled or self.needs_full_build()
+                or len(changed) + len(removed) > len(stored) * self.REBUILD_RATIO):
+            self.build_index(workers, progress, positions, memory_budget)
+            self.export_flat()
+            return added, [doc_name for doc_name in changed if doc_name in stored], removed
         
-        for doc_name, freqs in doc_freqs.items():
-            norm = 0
-            for term, tf in freqs.items():
-                df = len(term_docs[term])
-                idf = math.log((total + 1) / (df + 1)) + 1
-                tfidf = (1 + math.log(tf)) * idf
-                norm += tfidf * tfidf
-            norm = math.sqrt(norm)
-            cur.execute('INSERT OR REPLACE INTO doc_meta VALUES (?, ?)', (doc_name, norm))
+        updated = []
+        touched = []
+        documents = []
+        for number, doc_name in enumerate(changed, 1):
+            text, state = self.read_file(os.path.join(self.data_path, doc_name + '.txt'))
+            if doc_name in stored and stored[doc_name][2] == state[2]:
+                touched.append((state[0], state[1], doc_name))
+                continue
+            if doc_name in stored:
+                updated.append(doc_name)
+            tokens = self.tokenize(text)
+            documents.append((doc_name, Counter(tokens), self.term_positions(tokens) if positions else None, state))
+            if progress:
+                progress(number, len(changed))
         
-        cur.execute('INSERT OR REPLACE INTO metadata VALUES ("total_docs", ?)', (total,))
-        conn.commit()
-        conn.close()
+        with conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            cur.executemany('UPDATE doc_meta SET size = ?, mtime = ? WHERE filename = ?', touched)
+            for doc_name in removed:
+                self.remove_postings(cur, doc_name)
+                self.invalidate_similar(cur, doc_name)
+            for doc_name, freqs, doc_positions, state in documents:
+                self.remove_postings(cur, doc_name)
+                self.add_postings(cur, doc_name, freqs, doc_positions, state)
+                self.invalidate_similar(cur, doc_name)
+            if removed or documents:
+                self.increase_generation(cur)
+        return added, updated, removed
 
-    def get_total_docs(self):
-        conn = sqlite3.connect(self.db_path)
+    def needs_full_build(self):
+        conn = Database.connect(self.db_path)
+        cur = conn.cursor()
+        if self.get_metadata(cur, 'postings_format') != self.POSTINGS_FORMAT:
+            return True
+        cur.execute('SELECT 1 FROM doc_meta WHERE terms IS NULL OR doc_id IS NULL OR length IS NULL LIMIT 1')
+        if cur.fetchone() is not None:
+            return True
+        if self.positions_enabled():
+            cur.execute('SELECT 1 FROM index_table i LEFT JOIN positions_table p ON p.term = i.term '
+                        'WHERE i.postings IS NOT NULL AND p.term IS NULL LIMIT 1')
+            return cur.fetchone() is not None
+        return False
+
+    def positions_enabled(self):
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
-        cur.execute('SELECT value FROM metadata WHERE key="total_docs"')
+        return bool(self.get_metadata(cur, 'positions'))
+
+    def add_postings(self, cur, doc_name, freqs, positions=None, state=None):
+        doc_id = self.get_metadata(cur, 'next_doc_id')
+        self.set_metadata(cur, 'next_doc_id', doc_id + 1)
+        length = sum(freqs.values())
+        cur.execute('INSERT INTO segments (docs) VALUES (1)')
+        segment = cur.lastrowid
+        
+        rows = []
+        for term, tf in freqs.items():
+            term_positions = self.codec.encode_positions([positions[term]]) if positions is not None else None
+            rows.append((segment, term, self.codec.encode([doc_id], [tf]), term_positions))
+        cur.executemany('INSERT INTO segment_postings (segment, term, postings, positions) VALUES (?, ?, ?, ?)', rows)
+        cur.executemany('INSERT INTO index_table (term, postings, df, max_weight, max_tf, min_length) '
+                        'VALUES (?, NULL, 1, 0, ?, ?) ON CONFLICT(term) DO UPDATE SET df = df + 1, '
+                        'max_tf = max(COALESCE(max_tf, 0), excluded.max_tf), '
+                        'min_length = min(COALESCE(min_length, excluded.min_length), excluded.min_length)',
+                        [(term, tf, length) for term, tf in freqs.items()])
+        total = self.change_total_docs(cur, 1, length)
+        norm = self.compute_norm(freqs, self.get_dfs(cur, freqs), total)
+        cur.execute('INSERT INTO doc_meta (filename, norm, terms, doc_id, length, segment, size, mtime, fingerprint) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (doc_name, norm, pickle.dumps(dict(freqs)), doc_id, length, segment)
+                    + (state or (None, None, None)))
+        if norm > 0:
+            cur.executemany('UPDATE index_table SET max_weight = max(COALESCE(max_weight, 0), ?) WHERE term = ?',
+                            [((1 + math.log(tf)) / norm, term) for term, tf in freqs.items()])
+
+    def remove_postings(self, cur, doc_name):
+        cur.execute('SELECT terms, doc_id, length, segment FROM doc_meta WHERE filename = ?', (doc_name,))
+        row = cur.fetchone()
+        if not row:
+            return
+        terms = list(pickle.loads(row[0]))
+        doc_id = row[1]
+        length = row[2] or 0
+        cur.execute('INSERT OR REPLACE INTO tombstones VALUES (?, ?)', (doc_id, row[3] or 0))
+        
+        empty = []
+        for term in terms:
+            cur.execute('UPDATE index_table SET df = df - 1 WHERE term = ?', (term,))
+            cur.execute('SELECT df FROM index_table WHERE term = ?', (term,))
+            found = cur.fetchone()
+            if found and found[0] <= 0:
+                empty.append((term,))
+        cur.executemany('DELETE FROM index_table WHERE term = ?', empty)
+        cur.executemany('DELETE FROM positions_table WHERE term = ?', empty)
+        cur.executemany('DELETE FROM segment_postings WHERE term = ?', empty)
+        
+        cur.execute('DELETE FROM doc_meta WHERE filename = ?', (doc_name,))
+        self.change_total_docs(cur, -1, -length)
+
+    def get_dfs(self, cur, terms):
+        terms = list(terms)
+        dfs = {}
+        for start in range(0, len(terms), 500):
+            chunk = terms[start:start + 500]
+            placeholders = ','.join('?' for _ in chunk)
+            cur.execute(f'SELECT term, df FROM index_table WHERE term IN ({placeholders})', chunk)
+            dfs.update(cur.fetchall())
+        return dfs
+
+    def compute_norm(self, freqs, dfs, total):
+        norm = 0
+        for term, tf in freqs.items():
+            tfidf = (1 + math.log(tf)) * self.idf_from_df(dfs.get(term) or 0, total)
+            norm += tfidf * tfidf
+        return math.sqrt(norm)
+
+    def recompute_norms(self, cur):
+        total = self.get_metadata(cur, 'total_docs')
+        cur.execute('SELECT term, df FROM index_table')
+        dfs = dict(cur.fetchall())
+        max_weights = dict.fromkeys(dfs, 0)
+        last_id = -1
+        while True:
+            cur.execute('SELECT doc_id, terms FROM doc_meta WHERE doc_id > ? ORDER BY doc_id LIMIT ?',
+                        (last_id, self.BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = []
+            for doc_id, terms_blob in rows:
+                terms = pickle.loads(terms_blob)
+                norm = self.compute_norm(terms, dfs, total)
+                updates.append((norm, doc_id))
+                if norm > 0:
+                    for term, tf in terms.items():
+                        max_weights[term] = max(max_weights.get(term, 0), (1 + math.log(tf)) / norm)
+            cur.executemany('UPDATE doc_meta SET norm = ? WHERE doc_id = ?', updates)
+        cur.executemany('UPDATE index_table SET max_weight = ? WHERE term = ?',
+                        [(weight, term) for term, weight in max_weights.items()])
+
+    def change_total_docs(self, cur, delta, length_delta=0):
+        total = max(0, self.get_metadata(cur, 'total_docs') + delta)
+        self.set_metadata(cur, 'total_docs', total)
+        self.set_metadata(cur, 'total_length', max(0, self.get_metadata(cur, 'total_length') + length_delta))
+        return total
+
+    def get_metadata(self, cur, key):
+        cur.execute('SELECT value FROM metadata WHERE key = ?', (key,))
         row = cur.fetchone()
-        conn.close()
         return int(row[0]) if row else 0
 
-    def get_idf(self, term):
-        total = self.get_total_docs()
-        conn = sqlite3.connect(self.db_path)
+    def set_metadata(self, cur, key, value):
+        cur.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?)', (key, value))
+
+    def increase_generation(self, cur):
+        self.set_metadata(cur, 'generation', self.get_metadata(cur, 'generation') + 1)
+
+    def increase_base_version(self, cur):
+        self.set_metadata(cur, 'base_version', self.get_metadata(cur, 'base_version') + 1)
+
+    def get_base_version(self):
+        conn = Database.connect(self.db_path)
+        return self.get_metadata(conn.cursor(), 'base_version')
+
+    def export_flat(self):
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
-        cur.execute('SELECT postings FROM index_table WHERE term=?', (term,))
-        row = cur.fetchone()
-        conn.close()
-        if row:
-            postings = pickle.loads(row[0])
-            df = len(postings)
-            return math.log((total + 1) / (df + 1)) + 1
-        return math.log((total + 1) / 1) + 1
+        positions = self.positions_enabled()
+        base_version = self.get_base_version()
+        cur.execute('SELECT i.term, i.postings, p.positions FROM index_table i '
+                    'LEFT JOIN positions_table p ON p.term = i.term WHERE i.postings IS NOT NULL ORDER BY i.term')
+        self.flat = None
+        return FlatIndex.write(self.flat_path, base_version, self.decode_positions_rows(cur.fetchall()), positions)
+
+    def refresh_stats(self):
+        conn = Database.connect(self.db_path)
+        cur = conn.cursor()
+        generation = self.get_metadata(cur, 'generation')
+        if generation == self.stats_generation:
+            return
+        
+        if self.needs_full_build():
+            self.build_index()
+            self.refresh_stats()
+            return
+        
+        conn = Database.connect(self.db_path)
+        cur = conn.cursor()
+        self.total_docs = self.get_metadata(cur, 'total_docs')
+        self.total_length = self.get_metadata(cur, 'total_length')
+        cur.execute('SELECT term, df, max_weight, max_tf, min_length FROM index_table')
+        self.term_dfs = {}
+        self.term_max_weights = {}
+        self.term_max_tfs = {}
+        self.term_min_lengths = {}
+        for term, df, max_weight, max_tf, min_length in cur.fetchall():
+            self.term_dfs[term] = df
+            self.term_max_weights[term] = max_weight
+            self.term_max_tfs[term] = max_tf
+            self.term_min_lengths[term] = min_length
+        self.sorted_terms = sorted(self.term_dfs)
+        cur.execute('SELECT filename, doc_id, norm, length FROM doc_meta')
+        self.doc_ids = {}
+        self.doc_names = {}
+        self.doc_norms = {}
+        self.doc_lengths = {}
+        for doc_name, doc_id, norm, length in cur.fetchall():
+            self.doc_ids[doc_name] = doc_id
+            self.doc_names[doc_id] = doc_name
+            self.doc_norms[doc_id] = norm
+            self.doc_lengths[doc_id] = length or 0
+        cur.execute('SELECT doc_id FROM tombstones')
+        self.tombstones = {row[0] for row in cur.fetchall()}
+        self.base_version = self.get_base_version()
+        if self.flat is not None and self.flat.base_version != self.base_version:
+            self.flat = None
+        self.flat_mtime = None
+        self.stats_generation = generation
+
+    def load_stats_once(self):
+        if self.stats_generation is None:
+            self.refresh_stats()
+
+    def idf_from_df(self, df, total):
+        return math.log((total + 1) / (df + 1)) + 1
+
+    def get_total_docs(self):
+        self.load_stats_once()
+        return self.total_docs
+
+    def get_idf(self, term):
+        self.load_stats_once()
+        return self.idf_from_df(self.term_dfs.get(term, 0), self.total_docs)
+
+    def get_max_weight(self, term):
+        self.load_stats_once()
+        max_weight = self.term_max_weights.get(term)
+        if max_weight is None:
+            return 1 / self.get_idf(term)
+        return max_weight
+
+    def get_average_length(self):
+        self.load_stats_once()
+        if not self.total_docs:
+            return 0
+        return self.total_length / self.total_docs
+
+    def get_terms_with_prefix(self, prefix, limit=None):
+        self.load_stats_once()
+        start = bisect_left(self.sorted_terms, prefix)
+        end = bisect_left(self.sorted_terms, prefix + '\U0010ffff', start)
+        terms = self.sorted_terms[start:end]
+        if limit:
+            return heapq.nlargest(limit, terms, key=lambda t: self.term_dfs[t])
+        return sorted(terms, key=lambda t: self.term_dfs[t], reverse=True)
 
     def create_vector(self, text):
         tokens = self.tokenize(text)
         if not tokens:
             return {}
-        freqs = Counter(tokens)
+        return self.vector_from_freqs(Counter(tokens))
+
+    def vector_from_freqs(self, freqs):
         vector = {}
         for term, tf in freqs.items():
             idf = self.get_idf(term)
@@ -113,7 +617,7 @@ class Index:
 
     def extract_keywords(self, text, top_n=5):
         from backend.core.text_preprocess import TextPreprocessor
-        preprocessor = TextPreprocessor()
+        preprocessor = TextPreprocessor.get_instance()
         
         original_words = re.findall(r'\w+', text)
         vector = self.create_vector(text)
@@ -132,21 +636,156 @@ class Index:
         
         return keywords_original
 
-    def get_postings(self, terms):
+    def get_flat(self):
+        if self.flat is None and self.base_version is not None:
+            try:
+                mtime = os.stat(self.flat_path).st_mtime_ns
+            except OSError:
+                return None
+            if mtime != self.flat_mtime:
+                self.flat_mtime = mtime
+                self.flat = FlatIndex.open(self.flat_path, self.base_version)
+        return self.flat
+
+    def get_postings(self, terms, flat=True):
         if not terms:
             return {}
-        conn = sqlite3.connect(self.db_path)
+        terms = list(terms)
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
         placeholders = ','.join('?' for _ in terms)
-        cur.execute(f'SELECT term, postings FROM index_table WHERE term IN ({placeholders})', terms)
-        rows = cur.fetchall()
-        conn.close()
-        return {term: pickle.loads(blob) for term, blob in rows}
+        flat_index = self.get_flat() if flat else None
+        if flat_index is not None:
+            parts = {}
+            for term in terms:
+                postings = flat_index.get_postings(term)
+                if postings is not None:
+                    parts[term] = [postings]
+        else:
+            cur.execute(f'SELECT term, postings FROM index_table WHERE term IN ({placeholders})', terms)
+            parts = {term: [self.codec.decode(blob)] if blob else [] for term, blob in cur.fetchall()}
+        cur.execute(f'SELECT term, postings FROM segment_postings WHERE term IN ({placeholders}) '
+                    f'ORDER BY term, segment', terms)
+        for term, blob in cur.fetchall():
+            parts.setdefault(term, []).append(self.codec.decode(blob))
+        postings = {}
+        for term, term_parts in parts.items():
+            doc_ids, tfs = self.merge_segments(term_parts)
+            if doc_ids:
+                postings[term] = (doc_ids, tfs)
+        return postings
 
-    def get_doc_norm(self, doc_name):
-        conn = sqlite3.connect(self.db_path)
+    def get_all_postings(self):
+        conn = Database.connect(self.db_path)
+        cur = conn.cursor()
+        cur.execute('SELECT term, postings FROM segment_postings ORDER BY term, segment')
+        segment_parts = {}
+        for term, blob in cur.fetchall():
+            segment_parts.setdefault(term, []).append(self.codec.decode(blob))
+        cur.execute('SELECT term, postings FROM index_table')
+        for term, blob in cur:
+            doc_ids, tfs = self.merge_segments(([self.codec.decode(blob)] if blob else []) +
+                                               segment_parts.get(term, []))
+            if doc_ids:
+                yield term, (doc_ids, tfs)
+
+    def merge_segments(self, parts):
+        if len(parts) == 1 and not self.tombstones:
+            return parts[0]
+        doc_ids = array('I')
+        tfs = array('I')
+        for part_ids, part_tfs in parts:
+            if self.tombstones and not self.tombstones.isdisjoint(part_ids):
+                for doc_id, tf in zip(part_ids, part_tfs):
+                    if doc_id not in self.tombstones:
+                        doc_ids.append(doc_id)
+                        tfs.append(tf)
+            else:
+                doc_ids.extend(part_ids)
+                tfs.extend(part_tfs.tolist())
+        return doc_ids, tfs
+
+    def get_positions(self, terms, doc_ids):
+        if not terms:
+            return {}
+        terms = list(terms)
+        conn = Database.connect(self.db_path)
+        cur = conn.cursor()
+        placeholders = ','.join('?' for _ in terms)
+        rows = []
+        flat_index = self.get_flat()
+        if flat_index is not None and flat_index.has_positions:
+            for term in terms:
+                base = flat_index.get_positions(term)
+                if base is not None:
+                    rows.append((term,) + base)
+        else:
+            cur.execute(f'SELECT i.term, i.postings, p.positions FROM index_table i '
+                        f'JOIN positions_table p ON p.term = i.term WHERE i.term IN ({placeholders})', terms)
+            rows.extend(self.decode_positions_rows(cur.fetchall()))
+        cur.execute(f'SELECT term, postings, positions FROM segment_postings '
+                    f'WHERE term IN ({placeholders}) AND positions IS NOT NULL', terms)
+        rows.extend(self.decode_positions_rows(cur.fetchall()))
+        positions_map = {}
+        for term, term_doc_ids, tfs, deltas in rows:
+            doc_positions = positions_map.setdefault(term, {})
+            offset = 0
+            for doc_id, tf in zip(term_doc_ids, tfs):
+                if doc_id in doc_ids:
+                    doc_positions[doc_id] = self.codec.split_positions(deltas, offset, tf)
+                offset += tf
+        return positions_map
+
+    def decode_positions_rows(self, rows):
+        decoded = []
+        for term, postings_blob, positions_blob in rows:
+            doc_ids, tfs = self.codec.decode(postings_blob)
+            deltas = self.codec.decode_positions(positions_blob) if positions_blob else ()
+            decoded.append((term, doc_ids, tfs, deltas))
+        return decoded
+
+    def get_document_terms(self, doc_name):
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
-        cur.execute('SELECT norm FROM doc_meta WHERE filename = ?', (doc_name,))
+        cur.execute('SELECT terms FROM doc_meta WHERE filename = ?', (doc_name,))
         row = cur.fetchone()
-        conn.close()
-        return float(row[0]) if row else 0.0
+        if not row or row[0] is None:
+            return {}
+        return pickle.loads(row[0])
+
+    def get_similar(self, doc_name):
+        conn = Database.connect(self.db_path)
+        cur = conn.cursor()
+        cur.execute('SELECT similar, score FROM similar_docs WHERE filename = ? ORDER BY score DESC', (doc_name,))
+        return cur.fetchall()
+
+    def get_all_similar(self):
+        conn = Database.connect(self.db_path)
+        cur = conn.cursor()
+        cur.execute('SELECT filename, similar, score FROM similar_docs ORDER BY filename, score DESC')
+        neighbors = {}
+        for doc_name, similar, score in cur.fetchall():
+            neighbors.setdefault(doc_name, []).append((similar, score))
+        return neighbors
+
+    def save_similar(self, neighbors, generation, replace_all=False):
+        conn = Database.connect(self.db_path)
+        with conn:
+            cur = conn.cursor()
+            if self.get_metadata(cur, 'generation') != generation:
+                return False
+            if replace_all:
+                cur.execute('DELETE FROM similar_docs')
+            for doc_name, ranked in neighbors.items():
+                cur.execute('DELETE FROM similar_docs WHERE filename = ?', (doc_name,))
+                cur.executemany('INSERT INTO similar_docs (filename, similar, score) VALUES (?, ?, ?)',
+                                [(doc_name, similar, score) for similar, score in ranked])
+        return True
+
+    def invalidate_similar(self, cur, doc_name):
+        cur.execute('DELETE FROM similar_docs WHERE filename = ? OR filename IN '
+                    '(SELECT filename FROM similar_docs WHERE similar = ?)', (doc_name, doc_name))
+
+    def get_doc_norm(self, doc_name):
+        self.load_stats_once()
+        return self.doc_norms.get(self.doc_ids.get(doc_name)) or 0.0
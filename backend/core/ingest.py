@@ -0,0 +1,166 @@
+import os
+import re
+import math
+import uuid
+import heapq
+import codecs
+import pickle
+import tempfile
+from array import array
+from collections import Counter, defaultdict
+from backend.core.database import Database
+from backend.core.index import Index
+from backend.core.postings import PostingsBuffer
+from backend.core.text_preprocess import TextPreprocessor
+
+
+class BulkImporter:
+    CHUNK_SIZE = 64 * 1024
+    POSTINGS_BUDGET = 1000000
+    BATCH_SIZE = 1000
+    KEYWORDS = 7
+    WORD_CACHE_SIZE = 100000
+    WORD_PATTERN = re.compile(r'\w+')
+
+    def __init__(self, index=None, postings_budget=None, positions=None):
+        self.index = index or Index()
+        self.postings_budget = postings_budget or self.POSTINGS_BUDGET
+        self.positions = self.index.positions_enabled() if positions is None else positions
+        self.preprocessor = TextPreprocessor.get_instance()
+        self.word_cache = {}
+        self.buffer = PostingsBuffer(self.postings_budget)
+        self.dfs = Counter()
+
+    def run(self, progress=None):
+        from backend.core.document_manager import Document
+        Document.init_storage()
+        os.makedirs(self.index.data_path, exist_ok=True)
+        files = sorted((f for f in os.listdir(self.index.data_path) if f.endswith('.txt')), key=lambda f: f[:-4])
+        
+        with tempfile.TemporaryFile() as records:
+            total = 0
+            for record in self.accumulate_postings(self.extract_words(self.preprocess(self.decode(files)))):
+                pickle.dump(record, records, pickle.HIGHEST_PROTOCOL)
+                total += 1
+                if progress:
+                    progress(total, len(files))
+            records.seek(0)
+            added = self.write_index(records, total)
+        return added, total
+
+    def decode(self, files):
+        for filename in files:
+            path = os.path.join(self.index.data_path, filename)
+            stat = os.stat(path)
+            fingerprint = self.index.new_fingerprint()
+            yield filename[:-4], path, self.read_pieces(filename, fingerprint), (stat, fingerprint)
+
+    def read_pieces(self, filename, fingerprint):
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        carry = ''
+        with open(os.path.join(self.index.data_path, filename), 'rb') as f:
+            while True:
+                data = f.read(self.CHUNK_SIZE)
+                fingerprint.update(data)
+                text = carry + decoder.decode(data, final=not data)
+                if not data:
+                    break
+                cut = max(text.rfind(' '), text.rfind('\n')) + 1
+                carry = text[cut:]
+                if cut:
+                    yield text[:cut]
+        if text:
+            yield text
+
+    def preprocess(self, documents):
+        for doc_name, path, pieces, (stat, fingerprint) in documents:
+            freqs = Counter()
+            positions = defaultdict(list) if self.positions else None
+            first_words = {}
+            has_text = False
+            offset = 0
+            for piece in pieces:
+                tokens = []
+                for word in self.WORD_PATTERN.findall(piece):
+                    processed = self.preprocess_word(word)
+                    if processed not in first_words:
+                        first_words[processed] = word
+                    tokens.extend(processed.split())
+                freqs.update(tokens)
+                if positions is not None:
+                    for position, term in enumerate(tokens, offset):
+                        positions[term].append(position)
+                offset += len(tokens)
+                has_text = has_text or bool(piece.strip())
+            state = (stat.st_size, stat.st_mtime_ns, fingerprint.hexdigest())
+            yield doc_name, path, freqs, positions, first_words if has_text else None, state
+
+    def preprocess_word(self, word):
+        processed = self.word_cache.get(word)
+        if processed is None:
+            if len(self.word_cache) >= self.WORD_CACHE_SIZE:
+                self.word_cache.clear()
+            processed = self.preprocessor.preprocess(word)
+            self.word_cache[word] = processed
+        return processed
+
+    def extract_words(self, documents):
+        for doc_name, path, freqs, positions, first_words, state in documents:
+            if first_words is not None:
+                first_words = {term: first_words[term] for term in freqs if term in first_words}
+            yield doc_name, path, freqs, positions, first_words, state
+
+    def accumulate_postings(self, documents):
+        for doc_id, (doc_name, path, freqs, positions, first_words, state) in enumerate(documents):
+            self.buffer.add(doc_id, freqs, positions)
+            self.dfs.update(freqs.keys())
+            yield doc_name, path, dict(freqs), first_words, state
+
+    def write_index(self, records, total):
+        from backend.core.document_manager import Document
+        
+        idfs = {term: self.index.idf_from_df(df, total) for term, df in self.dfs.items()}
+        cur_docs = Database.connect(Document.DB_PATH).cursor()
+        cur_docs.execute('SELECT name FROM documents')
+        existing = {row[0] for row in cur_docs.fetchall()}
+        
+        norms = array('d')
+        lengths = array('I')
+        added = 0
+        conn = Database.connect(self.index.db_path)
+        doc_conn = Database.connect(Document.DB_PATH)
+        with conn, doc_conn:
+            cur = conn.cursor()
+            self.index.clear_index(cur)
+            
+            doc_rows = []
+            document_rows = []
+            keyword_rows = []
+            for doc_id, (doc_name, path, freqs, first_words, state) in enumerate(PostingsBuffer.read_records(records)):
+                weights = {term: (1 + math.log(tf)) * idfs[term] for term, tf in freqs.items()}
+                norm = math.sqrt(sum(w * w for w in weights.values()))
+                norms.append(norm)
+                lengths.append(sum(freqs.values()))
+                doc_rows.append((doc_name, norm, pickle.dumps(freqs), doc_id, lengths[doc_id]) + state)
+                if first_words is not None and doc_name not in existing:
+                    document_id = str(uuid.uuid4())
+                    document_rows.append((document_id, doc_name, path))
+                    top_stems = heapq.nlargest(self.KEYWORDS, weights, key=weights.get)
+                    for stem in top_stems:
+                        if stem in first_words:
+                            keyword_rows.append((document_id, first_words[stem], stem))
+                    added += 1
+                if len(doc_rows) >= self.BATCH_SIZE:
+                    self.write_documents(cur, doc_conn, doc_rows, document_rows, keyword_rows)
+                    doc_rows, document_rows, keyword_rows = [], [], []
+            self.write_documents(cur, doc_conn, doc_rows, document_rows, keyword_rows)
+            
+            self.index.write_merged_postings(cur, self.buffer.merge(), norms, lengths, self.positions)
+            self.index.write_metadata(cur, total, sum(lengths), self.positions)
+        return added
+
+    def write_documents(self, cur, doc_conn, doc_rows, document_rows, keyword_rows):
+        self.index.write_doc_meta(cur, doc_rows)
+        doc_conn.executemany('INSERT OR REPLACE INTO documents (id, name, file_path) VALUES (?, ?, ?)',
+                             document_rows)
+        doc_conn.executemany('INSERT INTO keywords (document_id, keyword, stem) VALUES (?, ?, ?)', keyword_rows)
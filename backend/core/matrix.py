@@ -0,0 +1,82 @@
+import heapq
+from array import array
+
+
+class TermMatrix:
+    def __init__(self, index, ranker):
+        self.index = index
+        self.ranker = ranker
+        self.generation = None
+        self.rows = {}
+        self.indptr = array('Q', [0])
+        self.indices = array('I')
+        self.data = array('d')
+
+    def refresh(self):
+        self.index.refresh_stats()
+        if self.generation == self.index.stats_generation:
+            return
+        
+        rows = {}
+        indptr = array('Q', [0])
+        indices = array('I')
+        data = array('d')
+        for term, (doc_ids, tfs) in self.index.get_all_postings():
+            for doc_id, tf in zip(doc_ids, tfs):
+                weight = self.ranker.doc_weight(term, doc_id, tf)
+                if weight == 0:
+                    continue
+                indices.append(doc_id)
+                data.append(weight)
+            rows[term] = len(indptr) - 1
+            indptr.append(len(indices))
+        
+        self.rows = rows
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.generation = self.index.stats_generation
+
+    def normalize(self, query_vector):
+        weights = self.ranker.query_weights(query_vector)
+        return {term: weight for term, weight in weights.items() if term in self.rows}
+
+    def multiply(self, query_vectors):
+        queries = [self.normalize(vector) for vector in query_vectors]
+        term_queries = {}
+        for position, query in enumerate(queries):
+            for term, weight in query.items():
+                term_queries.setdefault(term, []).append((position, weight))
+        
+        results = [{} for _ in queries]
+        for term, entries in term_queries.items():
+            row = self.rows[term]
+            start = self.indptr[row]
+            end = self.indptr[row + 1]
+            doc_ids = self.indices[start:end]
+            weights = self.data[start:end]
+            for position, q_weight in entries:
+                scores = results[position]
+                for doc_id, weight in zip(doc_ids, weights):
+                    scores[doc_id] = scores.get(doc_id, 0) + q_weight * weight
+        return results
+
+    def rank_many(self, query_vectors, min_score, top_k=None, skip_doc=None, allowed_ids=None):
+        self.refresh()
+        doc_names = self.index.doc_names
+        skip_id = self.index.doc_ids.get(skip_doc)
+        ranked_lists = []
+        for scores in self.multiply(query_vectors):
+            ranked = []
+            for doc_id, score in scores.items():
+                if score <= min_score or doc_id == skip_id:
+                    continue
+                if allowed_ids is not None and doc_id not in allowed_ids:
+                    continue
+                ranked.append((doc_names[doc_id], score))
+            if top_k:
+                ranked = heapq.nlargest(top_k, ranked, key=lambda r: r[1])
+            else:
+                ranked.sort(key=lambda r: r[1], reverse=True)
+            ranked_lists.append(ranked)
+        return ranked_lists
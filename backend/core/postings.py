@@ -0,0 +1,137 @@
+import sys
+import heapq
+import pickle
+import struct
+import tempfile
+from array import array
+from itertools import accumulate
+
+
+class PostingsCodec:
+    TYPECODES = {1: 'B', 2: 'H', 4: 'I'}
+
+    def encode(self, doc_ids, tfs):
+        deltas = []
+        previous = 0
+        for doc_id in doc_ids:
+            deltas.append(doc_id - previous)
+            previous = doc_id
+        return struct.pack('<I', len(deltas)) + self.pack_numbers(deltas) + self.pack_numbers(tfs)
+
+    def decode(self, blob):
+        count = struct.unpack_from('<I', blob, 0)[0]
+        view = memoryview(blob)
+        deltas, offset = self.unpack_numbers(view, 4, count)
+        tfs, offset = self.unpack_numbers(view, offset, count)
+        return array('I', accumulate(deltas)), tfs
+
+    def encode_positions(self, position_lists):
+        deltas = []
+        for positions in position_lists:
+            self.extend_deltas(deltas, positions)
+        return self.pack_positions(deltas)
+
+    def extend_deltas(self, deltas, positions):
+        previous = 0
+        for position in positions:
+            deltas.append(position - previous)
+            previous = position
+
+    def pack_positions(self, deltas):
+        return struct.pack('<I', len(deltas)) + self.pack_numbers(deltas)
+
+    def decode_positions(self, blob):
+        count = struct.unpack_from('<I', blob, 0)[0]
+        deltas, offset = self.unpack_numbers(memoryview(blob), 4, count)
+        return deltas
+
+    def split_positions(self, deltas, start, tf):
+        return list(accumulate(deltas[start:start + tf]))
+
+    def pack_numbers(self, numbers):
+        largest = max(numbers) if numbers else 0
+        if largest < 256:
+            width = 1
+        elif largest < 65536:
+            width = 2
+        else:
+            width = 4
+        packed = array(self.TYPECODES[width], numbers)
+        if sys.byteorder == 'big':
+            packed.byteswap()
+        return bytes([width]) + packed.tobytes()
+
+    def unpack_numbers(self, view, offset, count):
+        width = view[offset]
+        start = offset + 1
+        end = start + count * width
+        numbers = array(self.TYPECODES[width])
+        numbers.frombytes(view[start:end])
+        if sys.byteorder == 'big':
+            numbers.byteswap()
+        return numbers, end
+
+
+class PostingsBuffer:
+    def __init__(self, budget):
+        self.budget = budget
+        self.postings = {}
+        self.buffered = 0
+        self.runs = []
+
+    def add(self, doc_id, freqs, positions=None):
+        for term, tf in freqs.items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = (array('I'), array('I'), [] if positions is not None else None)
+                self.postings[term] = entry
+            entry[0].append(doc_id)
+            entry[1].append(tf)
+            if positions is not None:
+                entry[2].append(positions[term])
+        self.buffered += len(freqs)
+        if self.buffered >= self.budget:
+            self.spill()
+
+    def spill(self):
+        run = tempfile.TemporaryFile()
+        for term in sorted(self.postings):
+            pickle.dump((term, self.postings[term]), run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self.runs.append(run)
+        self.postings = {}
+        self.buffered = 0
+
+    @staticmethod
+    def read_records(f):
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+    def merge(self):
+        streams = [self.read_records(run) for run in self.runs]
+        streams.append((term, self.postings[term]) for term in sorted(self.postings))
+        term = None
+        merged = None
+        for next_term, (ids, tfs, positions) in heapq.merge(*streams, key=lambda item: item[0]):
+            if next_term != term:
+                if merged is not None:
+                    yield term, merged
+                term = next_term
+                merged = (array('I'), array('I'), [] if positions is not None else None)
+            merged[0].extend(ids)
+            merged[1].extend(tfs)
+            if positions is not None:
+                merged[2].extend(positions)
+        if merged is not None:
+            yield term, merged
+        self.close()
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+        self.postings = {}
+        self.buffered = 0
@@ -0,0 +1,60 @@
+import math
+
+
+class CosineRanker:
+    MIN_SCORE = 0.1
+
+    def __init__(self, index):
+        self.index = index
+
+    def query_weights(self, query_vector):
+        norm_q = math.sqrt(sum(v * v for v in query_vector.values()))
+        if norm_q == 0:
+            return {}
+        return {term: weight * self.index.get_idf(term) / norm_q for term, weight in query_vector.items()}
+
+    def doc_weight(self, term, doc_id, tf):
+        norm_d = self.index.doc_norms.get(doc_id) or 0
+        if tf <= 0 or norm_d == 0:
+            return 0
+        return (1 + math.log(tf)) / norm_d
+
+    def upper_bound(self, term):
+        return self.index.get_max_weight(term)
+
+
+class BM25Ranker:
+    MIN_SCORE = 0.0
+
+    def __init__(self, index, k1=1.2, b=0.75):
+        self.index = index
+        self.k1 = k1
+        self.b = b
+
+    def get_idf(self, term):
+        total = self.index.get_total_docs()
+        df = self.index.term_dfs.get(term, 0)
+        return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+    def query_weights(self, query_vector):
+        return {term: self.get_idf(term) * weight / self.index.get_idf(term)
+                for term, weight in query_vector.items() if weight > 0}
+
+    def doc_weight(self, term, doc_id, tf):
+        length = self.index.doc_lengths.get(doc_id)
+        if tf <= 0 or length is None:
+            return 0
+        return tf * (self.k1 + 1) / (tf + self.k1 * self.length_ratio(length))
+
+    def upper_bound(self, term):
+        max_tf = self.index.term_max_tfs.get(term)
+        min_length = self.index.term_min_lengths.get(term)
+        if not max_tf or min_length is None:
+            return self.k1 + 1
+        return max_tf * (self.k1 + 1) / (max_tf + self.k1 * self.length_ratio(min_length))
+
+    def length_ratio(self, length):
+        average = self.index.get_average_length()
+        if not average:
+            return 1
+        return 1 - self.b + self.b * length / average
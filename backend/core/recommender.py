@@ -1,10 +1,24 @@
 from collections import defaultdict
+from backend.core.database import Database
 
 
 class Recommender:
+    DECAY = 0.9
+    RESULTS_PER_QUERY = 10
+    RESCALE_LIMIT = 1e100
+
     def __init__(self, history):
         self.history = history
         self.engine = None
+        self.init_db()
+
+    def init_db(self):
+        conn = Database.connect(self.history.db_path)
+        cur = conn.cursor()
+        cur.execute('CREATE TABLE IF NOT EXISTS recommendations (document TEXT PRIMARY KEY, score REAL)')
+        cur.execute('CREATE INDEX IF NOT EXISTS recommendations_score ON recommendations (score)')
+        cur.execute('CREATE TABLE IF NOT EXISTS recommender_state (key TEXT PRIMARY KEY, value REAL)')
+        conn.commit()
 
     def set_engine(self, engine):
         self.engine = engine
@@ -13,18 +27,56 @@ class Recommender:
         if not self.engine:
             return []
         
-        queries = self.history.get_all()
-        if not queries:
-            return []
+        self.update_scores()
         
-        scores = defaultdict(float)
-        weight = 1.0
+        conn = Database.connect(self.history.db_path)
+        cur = conn.cursor()
+        cur.execute('SELECT document FROM recommendations ORDER BY score DESC, document LIMIT ?', (top_n,))
+        return [row[0] for row in cur.fetchall()]
+
+    def update_scores(self):
+        self.engine.index.refresh_stats()
+        generation = self.engine.index.stats_generation
+        
+        conn = Database.connect(self.history.db_path)
+        cur = conn.cursor()
+        cur.execute('SELECT key, value FROM recommender_state')
+        state = dict(cur.fetchall())
+        last_id = int(state.get('last_id', 0))
+        counted = int(state.get('counted', 0))
+        weight = state.get('next_weight', 1.0)
         
-        for query in queries:
-            results = self.engine.search(query, add_to_history=False)[:10]
+        entries = self.history.get_since(last_id)
+        rebuild = state.get('generation') != generation or self.history.count() != counted + len(entries)
+        if rebuild:
+            entries = self.history.get_since(0)
+            counted = 0
+            weight = 1.0
+        elif not entries:
+            return
+        
+        scores = defaultdict(float)
+        rescales = 0
+        for results in self.engine.search_many([query for query_id, query in entries], top_k=self.RESULTS_PER_QUERY):
             for rank, result in enumerate(results, 1):
                 scores[result.document.name] += weight * (1.0 / rank)
-            weight *= 0.9
+            weight /= self.DECAY
+            if weight > self.RESCALE_LIMIT:
+                for name in scores:
+                    scores[name] /= self.RESCALE_LIMIT
+                weight /= self.RESCALE_LIMIT
+                rescales += 1
         
-        sorted_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-        return [name for name, score in sorted_docs[:top_n]]
+        with conn:
+            if rebuild:
+                cur.execute('DELETE FROM recommendations')
+            for _ in range(rescales):
+                cur.execute('UPDATE recommendations SET score = score / ?', (self.RESCALE_LIMIT,))
+            cur.executemany('INSERT INTO recommendations (document, score) VALUES (?, ?) '
+                            'ON CONFLICT(document) DO UPDATE SET score = score + excluded.score',
+                            list(scores.items()))
+            if entries:
+                last_id = entries[-1][0]
+            cur.executemany('INSERT OR REPLACE INTO recommender_state VALUES (?, ?)',
+                            [('last_id', last_id), ('counted', counted + len(entries)),
+                             ('next_weight', weight), ('generation', generation)])
@@ -1,7 +1,13 @@
 import os
-import math
-import sqlite3
+import re
+import sys
+import time
+import heapq
 import datetime
+import threading
+from collections import OrderedDict
+from bisect import bisect_left
+from backend.core.database import Database
 
 
 class SearchResult:
@@ -18,147 +24,520 @@ class SearchHistory:
         self.init_db()
 
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
         cur.execute('CREATE TABLE IF NOT EXISTS history (id INTEGER PRIMARY KEY AUTOINCREMENT, query TEXT UNIQUE, timestamp TEXT)')
         conn.commit()
-        conn.close()
 
     def add(self, query):
         if not query or not query.strip():
             return
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute('SELECT id FROM history WHERE query = ?', (query,))
-        if not cur.fetchone():
-            cur.execute('INSERT INTO history (query, timestamp) VALUES (?, ?)', 
-                       (query, datetime.datetime.now().isoformat()))
-            conn.commit()
-        conn.close()
+        conn = Database.connect(self.db_path)
+        with conn:
+            cur = conn.cursor()
+            cur.execute('SELECT id FROM history WHERE query = ?', (query,))
+            if not cur.fetchone():
+                cur.execute('INSERT INTO history (query, timestamp) VALUES (?, ?)', 
+                           (query, datetime.datetime.now().isoformat()))
 
     def get_all(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
         cur.execute('SELECT query FROM history ORDER BY id DESC')
-        queries = [row[0] for row in cur.fetchall()]
-        conn.close()
-        return queries
+        return [row[0] for row in cur.fetchall()]
 
-    def clear(self):
-        conn = sqlite3.connect(self.db_path)
+    def get_since(self, last_id):
+        conn = Database.connect(self.db_path)
         cur = conn.cursor()
-        cur.execute('DELETE FROM history')
-        conn.commit()
-        conn.close()
+        cur.execute('SELECT id, query FROM history WHERE id > ? ORDER BY id', (last_id,))
+        return cur.fetchall()
+
+    def count(self):
+        conn = Database.connect(self.db_path)
+        cur = conn.cursor()
+        cur.execute('SELECT COUNT(*) FROM history')
+        return cur.fetchone()[0]
+
+    def clear(self):
+        conn = Database.connect(self.db_path)
+        with conn:
+            conn.execute('DELETE FROM history')
+
+
+class ResultCache:
+    def __init__(self, max_entries=256, max_bytes=4 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generation = None
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, generation):
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        created, size, ranked = entry
+        if time.monotonic() - created > self.ttl:
+            self.remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return ranked
+
+    def put(self, key, generation, ranked):
+        if generation != self.generation:
+            self.clear()
+            self.generation = generation
+        size = sys.getsizeof(repr(key)) + sum(sys.getsizeof(name) + 32 for name, score in ranked)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (time.monotonic(), size, ranked)
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        created, size, ranked = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def get_stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries), 'bytes': self.total_bytes}
 
 
 class SearchEngine:
-    def __init__(self):
+    SIMILAR_STORED = 10
+    POSTINGS_CACHE_ENTRIES = 4000000
+    MIN_PREFIX_LENGTH = 2
+    PREFIX_EXPANSIONS = 64
+    FUZZY_MIN_LENGTH = 4
+    FUZZY_EXPANSIONS = 3
+    FUZZY_PENALTY = 0.5
+    PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+    NEAR_PATTERN = re.compile(r'(\S+)\s+NEAR/(\d+)\s+(\S+)')
+
+    def __init__(self, index=None, use_matrix=False, ranker=None):
         from backend.core.index import Index
-        self.index = Index()
+        from backend.core.matrix import TermMatrix
+        from backend.core.fuzzy import FuzzyTermIndex
+        from backend.core.ranking import CosineRanker
+        self.index = index or Index()
         self.history = SearchHistory()
+        self.use_matrix = use_matrix
+        self.ranker = ranker or CosineRanker(self.index)
+        self.similarity = self.ranker if isinstance(self.ranker, CosineRanker) else CosineRanker(self.index)
+        self.matrix = TermMatrix(self.index, self.ranker)
+        self.fuzzy = FuzzyTermIndex(self.index)
+        self.cache = ResultCache()
+        self.postings_cache = OrderedDict()
+        self.postings_entries = 0
+        self.postings_generation = None
 
-    def search(self, query_text, filters=None, add_to_history=True):
+    def search(self, query_text, filters=None, add_to_history=True, top_k=None):
         if not query_text or not query_text.strip():
             raise ValueError("Поисковый запрос не может быть пустым")
         
         if add_to_history:
             self.history.add(query_text)
         
+        return self.search_many([query_text], top_k, filters)[0]
+
+    def search_many(self, queries, top_k=None, filters=None):
         from backend.core.text_preprocess import TextPreprocessor
         from backend.core.document_manager import Document
         
-        preprocessor = TextPreprocessor()
-        processed = preprocessor.preprocess(query_text)
-        query_vector = self.index.create_vector(processed)
+        self.index.refresh_stats()
+        generation = self.index.stats_generation
         
-        if not query_vector:
-            return []
+        preprocessor = TextPreprocessor.get_instance()
+        filter_key = ()
+        if filters:
+            filter_key = tuple(sorted(set(preprocessor.preprocess(f) for f in filters) - {''}))
         
-        query_terms = list(query_vector.keys())
-        postings_map = self.index.get_postings(query_terms)
+        ranked_lists = []
+        cache_keys = []
+        pending = []
+        for position, query_text in enumerate(queries):
+            query = self.normalize_query(query_text)
+            cache_key = (query, filter_key, top_k)
+            ranked = self.cache.get(cache_key, generation)
+            if ranked is None and any(query):
+                pending.append(position)
+            ranked_lists.append(ranked or [])
+            cache_keys.append(cache_key)
         
-        scores = {}
-        for term, postings in postings_map.items():
-            q_val = query_vector.get(term, 0)
-            idf = self.index.get_idf(term)
-            for doc_name, tf in postings:
-                if tf > 0:
-                    scores[doc_name] = scores.get(doc_name, 0) + q_val * (1 + math.log(tf)) * idf
-        
-        norm_q = math.sqrt(sum(v * v for v in query_vector.values()))
-        if norm_q == 0:
-            return []
-        
-        results = []
-        all_docs = {d.name: d for d in Document.get_all()}
-        
-        for doc_name, score in scores.items():
-            norm_d = self.index.get_doc_norm(doc_name)
-            if norm_d == 0:
-                continue
+        if pending:
+            query_vectors = [self.create_query_vector(cache_keys[position][0]) for position in pending]
             
-            similarity = score / (norm_q * norm_d)
-            if similarity <= 0.1:
-                continue
+            allowed_ids = None
+            if filters:
+                allowed_ids = self.filter_documents(filters)
             
-            doc = all_docs.get(doc_name)
-            if not doc:
-                continue
+            allowed_list = []
+            for position in pending:
+                constraints = cache_keys[position][0][2]
+                if constraints:
+                    matched = self.match_constraints(constraints)
+                    allowed_list.append(matched if allowed_ids is None else allowed_ids & matched)
+                else:
+                    allowed_list.append(allowed_ids)
             
-            if filters and not doc.matches_filters(filters):
-                continue
+            if self.use_matrix and all(allowed is allowed_ids for allowed in allowed_list):
+                computed = self.matrix.rank_many(query_vectors, self.ranker.MIN_SCORE, top_k, allowed_ids=allowed_ids)
+            elif self.use_matrix:
+                computed = [self.matrix.rank_many([query_vector], self.ranker.MIN_SCORE, top_k, allowed_ids=allowed)[0]
+                            for query_vector, allowed in zip(query_vectors, allowed_list)]
+            else:
+                terms = set()
+                for query_vector in query_vectors:
+                    terms.update(query_vector)
+                postings_map = self.get_postings(list(terms))
+                computed = [self.rank_postings(query_vector, self.ranker.MIN_SCORE, top_k, allowed_ids=allowed,
+                                               postings_map=postings_map)
+                            for query_vector, allowed in zip(query_vectors, allowed_list)]
             
-            results.append(SearchResult(doc, similarity))
+            for position, ranked in zip(pending, computed):
+                ranked_lists[position] = ranked
+                self.cache.put(cache_keys[position], generation, ranked)
+        
+        names = set()
+        for ranked in ranked_lists:
+            names.update(name for name, score in ranked)
+        all_docs = {d.name: d for d in Document.get_many(names)}
         
-        results.sort(key=lambda r: r.score, reverse=True)
+        results = []
+        for ranked in ranked_lists:
+            results.append([SearchResult(all_docs[name], score) for name, score in ranked if name in all_docs])
         return results
 
-    def get_similar_documents(self, doc_name, top_n=5):
+    def normalize_query(self, query_text):
+        from backend.core.text_preprocess import TextPreprocessor
+        preprocessor = TextPreprocessor.get_instance()
+        
+        text = query_text or ''
+        plain = []
+        constraints = []
+        for phrase in self.PHRASE_PATTERN.findall(text):
+            stems = preprocessor.preprocess(phrase).split()
+            if len(stems) > 1:
+                constraints.append((tuple(stems), None))
+            else:
+                plain.extend(stems)
+        text = self.PHRASE_PATTERN.sub(' ', text)
+        
+        for left, window, right in self.NEAR_PATTERN.findall(text):
+            left_stem = preprocessor.preprocess(left)
+            right_stem = preprocessor.preprocess(right)
+            if left_stem and right_stem and ' ' not in left_stem + right_stem:
+                constraints.append(((left_stem, right_stem), int(window)))
+            else:
+                plain.extend((left_stem + ' ' + right_stem).split())
+        text = self.NEAR_PATTERN.sub(' ', text)
+        
+        words = text.split()
+        terms = preprocessor.preprocess(' '.join(w for w in words if not w.endswith('*'))).split() + plain
+        prefixes = []
+        for word in words:
+            if word.endswith('*'):
+                prefix = preprocessor.normalize_prefix(word)
+                if len(prefix) >= self.MIN_PREFIX_LENGTH:
+                    prefixes.append(prefix)
+        return tuple(terms), tuple(prefixes), tuple(constraints)
+
+    def match_constraints(self, constraints):
+        matched = None
+        for stems, window in constraints:
+            doc_ids = self.match_positions(stems, window)
+            matched = doc_ids if matched is None else matched & doc_ids
+        return matched
+
+    def match_positions(self, stems, window=None):
+        postings_map = self.get_postings(list(set(stems)))
+        if len(postings_map) < len(set(stems)):
+            return set()
+        
+        candidates = None
+        for term in sorted(postings_map, key=lambda t: len(postings_map[t][0])):
+            candidates = set(postings_map[term][0]) if candidates is None else candidates & set(postings_map[term][0])
+            if not candidates:
+                return set()
+        if not self.index.positions_enabled():
+            return candidates
+        
+        positions_map = self.index.get_positions(set(stems), candidates)
+        matched = set()
+        for doc_id in candidates:
+            if window is None:
+                starts = set(positions_map[stems[0]][doc_id])
+                for offset, stem in enumerate(stems[1:], 1):
+                    starts.intersection_update(position - offset for position in positions_map[stem][doc_id])
+                    if not starts:
+                        break
+                if starts:
+                    matched.add(doc_id)
+            else:
+                right = positions_map[stems[1]][doc_id]
+                for position in positions_map[stems[0]][doc_id]:
+                    k = bisect_left(right, position - window)
+                    if k < len(right) and right[k] == position:
+                        k += 1
+                    if k < len(right) and right[k] <= position + window:
+                        matched.add(doc_id)
+                        break
+        return matched
+
+    def create_query_vector(self, query):
+        terms, prefixes, constraints = query
+        terms = list(terms)
+        for stems, window in constraints:
+            terms.extend(stems)
+        query_vector = self.index.create_vector(' '.join(terms))
+        for term in list(query_vector):
+            if term in self.index.term_dfs or len(term) < self.FUZZY_MIN_LENGTH:
+                continue
+            matches = self.fuzzy.lookup(term, self.FUZZY_EXPANSIONS)
+            if not matches:
+                continue
+            tf_weight = query_vector[term] / self.index.get_idf(term)
+            for match, distance in matches:
+                weight = tf_weight * self.index.get_idf(match) * self.FUZZY_PENALTY ** distance
+                query_vector[match] = query_vector.get(match, 0) + weight
+        for prefix in prefixes:
+            expansions = self.expand_prefix(prefix, self.PREFIX_EXPANSIONS)
+            total_df = sum(self.index.term_dfs[expansion] for expansion in expansions)
+            if not total_df:
+                continue
+            weight = self.index.idf_from_df(min(total_df, self.index.get_total_docs()), self.index.get_total_docs())
+            for expansion in expansions:
+                share = weight * self.index.term_dfs[expansion] / total_df
+                query_vector[expansion] = query_vector.get(expansion, 0) + share
+        return query_vector
+
+    def expand_prefix(self, prefix, limit):
+        from backend.core.text_preprocess import TextPreprocessor
+        terms = self.index.get_terms_with_prefix(prefix, limit)
+        if not terms:
+            terms = self.index.get_terms_with_prefix(TextPreprocessor.get_instance().stem(prefix), limit)
+        return terms
+
+    def complete(self, text, limit=10):
+        from backend.core.text_preprocess import TextPreprocessor
         from backend.core.document_manager import Document
         
-        doc = Document.get_by_name(doc_name)
-        if not doc:
+        self.index.refresh_stats()
+        head, _, last = text.rpartition(' ')
+        prefix = TextPreprocessor.get_instance().normalize_prefix(last)
+        if len(prefix) < self.MIN_PREFIX_LENGTH:
             return []
-        
-        text = doc.get_preprocessed_text()
-        if not text:
+        expansions = self.expand_prefix(prefix, self.PREFIX_EXPANSIONS)
+        if not expansions:
             return []
+        head = head + ' ' if head else ''
+        words = Document.get_words_by_stems(expansions)
+        completions = [head + prefix + '*']
+        for term in expansions:
+            word = words.get(term)
+            if word and head + word not in completions:
+                completions.append(head + word)
+        return completions[:limit]
+
+    def get_postings(self, terms):
+        if self.index.stats_generation != self.postings_generation:
+            self.postings_cache.clear()
+            self.postings_entries = 0
+            self.postings_generation = self.index.stats_generation
         
-        query_vector = self.index.create_vector(text)
-        if not query_vector:
+        missing = [term for term in dict.fromkeys(terms) if term not in self.postings_cache]
+        if missing:
+            fetched = self.index.get_postings(missing)
+            for term in missing:
+                postings = fetched.get(term)
+                self.postings_cache[term] = postings
+                if postings is not None:
+                    self.postings_entries += len(postings[0])
+        
+        postings_map = {}
+        for term in terms:
+            self.postings_cache.move_to_end(term)
+            if self.postings_cache[term] is not None:
+                postings_map[term] = self.postings_cache[term]
+        while self.postings_entries > self.POSTINGS_CACHE_ENTRIES:
+            term, postings = self.postings_cache.popitem(last=False)
+            if postings is not None:
+                self.postings_entries -= len(postings[0])
+        return postings_map
+
+    def filter_documents(self, filters):
+        from backend.core.text_preprocess import TextPreprocessor
+        from backend.core.document_manager import Document
+        
+        preprocessor = TextPreprocessor.get_instance()
+        stems = []
+        for f in filters:
+            stem = preprocessor.preprocess(f)
+            if stem:
+                stems.append(stem)
+        if not stems:
+            return None
+        
+        postings_map = self.get_postings(stems)
+        keyword_names = Document.get_names_by_keyword_stems(stems)
+        
+        allowed_ids = None
+        for stem in stems:
+            doc_ids = set()
+            if stem in postings_map:
+                doc_ids.update(postings_map[stem][0])
+            for name in keyword_names.get(stem, ()):
+                if name in self.index.doc_ids:
+                    doc_ids.add(self.index.doc_ids[name])
+            allowed_ids = doc_ids if allowed_ids is None else allowed_ids & doc_ids
+        return allowed_ids
+
+    def rank(self, query_vector, min_score, top_k=None, skip_doc=None, allowed_ids=None, ranker=None):
+        ranker = ranker or self.ranker
+        if self.use_matrix and ranker is self.ranker:
+            return self.matrix.rank_many([query_vector], min_score, top_k, skip_doc, allowed_ids)[0]
+        return self.rank_postings(query_vector, min_score, top_k, skip_doc, allowed_ids, ranker=ranker)
+
+    def rank_postings(self, query_vector, min_score, top_k=None, skip_doc=None, allowed_ids=None,
+                      postings_map=None, ranker=None):
+        ranker = ranker or self.ranker
+        query_weights = ranker.query_weights(query_vector)
+        if not query_weights:
             return []
         
-        query_terms = list(query_vector.keys())
-        postings_map = self.index.get_postings(query_terms)
+        if postings_map is None:
+            postings_map = self.get_postings(list(query_vector.keys()))
+        else:
+            postings_map = {term: postings_map[term] for term in query_vector if term in postings_map}
+        
+        weights = {}
+        bounds = {}
+        for term in postings_map:
+            weights[term] = query_weights.get(term, 0)
+            bounds[term] = weights[term] * ranker.upper_bound(term) * (1 + 1e-9)
         
+        skip_id = self.index.doc_ids.get(skip_doc)
+        remaining = sum(bounds.values())
+        threshold = min_score
         scores = {}
-        for term, postings in postings_map.items():
-            q_val = query_vector.get(term, 0)
-            idf = self.index.get_idf(term)
-            for d_name, tf in postings:
-                if d_name != doc_name and tf > 0:
-                    scores[d_name] = scores.get(d_name, 0) + q_val * (1 + math.log(tf)) * idf
-        
-        norm_q = math.sqrt(sum(v * v for v in query_vector.values()))
-        if norm_q == 0:
+        
+        for term in sorted(postings_map, key=lambda t: bounds[t], reverse=True):
+            accept_new = remaining > min_score and remaining >= threshold
+            remaining = max(0.0, remaining - bounds[term])
+            doc_ids, tfs = postings_map[term]
+            if accept_new:
+                matches = zip(doc_ids, tfs)
+            else:
+                matches = []
+                for doc_id in scores:
+                    position = bisect_left(doc_ids, doc_id)
+                    if position < len(doc_ids) and doc_ids[position] == doc_id:
+                        matches.append((doc_id, tfs[position]))
+            for doc_id, tf in matches:
+                if tf <= 0 or doc_id == skip_id:
+                    continue
+                if allowed_ids is not None and doc_id not in allowed_ids:
+                    continue
+                doc_weight = ranker.doc_weight(term, doc_id, tf)
+                if doc_weight == 0:
+                    continue
+                scores[doc_id] = scores.get(doc_id, 0) + weights[term] * doc_weight
+            
+            if top_k and len(scores) >= top_k:
+                threshold = max(min_score, heapq.nlargest(top_k, scores.values())[-1])
+                survivors = {}
+                for doc_id, score in scores.items():
+                    if score + remaining > min_score and score + remaining >= threshold:
+                        survivors[doc_id] = score
+                scores = survivors
+        
+        doc_names = self.index.doc_names
+        ranked = [(doc_names[doc_id], score) for doc_id, score in scores.items() if score > min_score]
+        if top_k:
+            return heapq.nlargest(top_k, ranked, key=lambda r: r[1])
+        ranked.sort(key=lambda r: r[1], reverse=True)
+        return ranked
+
+    def get_similar_documents(self, doc_name, top_n=5):
+        from backend.core.document_manager import Document
+        
+        self.index.refresh_stats()
+        if doc_name not in self.index.doc_ids:
             return []
         
+        ranked = []
+        if top_n <= self.SIMILAR_STORED:
+            ranked = self.index.get_similar(doc_name)
+        if not ranked:
+            ranked = self.compute_similar(doc_name, max(top_n, self.SIMILAR_STORED))
+            if top_n <= self.SIMILAR_STORED:
+                self.index.save_similar({doc_name: ranked}, self.index.stats_generation)
+        ranked = ranked[:top_n]
+        
         results = []
-        all_docs = {d.name: d for d in Document.get_all()}
+        all_docs = {d.name: d for d in Document.get_many(name for name, score in ranked)}
         
-        for d_name, score in scores.items():
-            norm_d = self.index.get_doc_norm(d_name)
-            if norm_d == 0:
-                continue
-            
-            similarity = score / (norm_q * norm_d)
-            if similarity <= 0:
-                continue
-            
+        for d_name, similarity in ranked:
             d = all_docs.get(d_name)
             if d:
                 results.append(SearchResult(d, similarity))
         
-        results.sort(key=lambda r: r.score, reverse=True)
-        return results[:top_n]
+        return results
+
+    def compute_similar(self, doc_name, top_n=None):
+        query_vector = self.index.vector_from_freqs(self.index.get_document_terms(doc_name))
+        if not query_vector:
+            return []
+        return self.rank(query_vector, 0, top_n, skip_doc=doc_name, ranker=self.similarity)
+
+    def precompute_similar_documents(self, only_missing=False):
+        while True:
+            self.index.refresh_stats()
+            stored = self.index.get_all_similar() if only_missing else {}
+            neighbors = {}
+            for doc_name in self.index.doc_ids:
+                if doc_name not in stored:
+                    neighbors[doc_name] = self.compute_similar(doc_name, self.SIMILAR_STORED)
+            if self.index.save_similar(neighbors, self.index.stats_generation, replace_all=not only_missing):
+                return len(neighbors)
+
+    def precompute_similar_in_background(self, only_missing=False):
+        from backend.core.index import Index
+        engine = SearchEngine(Index(self.index.data_path, self.index.db_path), self.use_matrix)
+        thread = threading.Thread(target=engine.precompute_similar_documents,
+                                  args=(only_missing,), daemon=True)
+        thread.start()
+        return thread
+
+    def update_similar_documents(self, doc_name):
+        self.index.refresh_stats()
+        if doc_name not in self.index.doc_ids:
+            return
+        
+        ranked = self.compute_similar(doc_name)
+        stored = self.index.get_all_similar()
+        neighbors = {doc_name: ranked[:self.SIMILAR_STORED]}
+        for other, score in ranked:
+            current = stored.get(other)
+            if current is None:
+                continue
+            if len(current) < self.SIMILAR_STORED or score > current[-1][1]:
+                current = current + [(doc_name, score)]
+                current.sort(key=lambda r: r[1], reverse=True)
+                neighbors[other] = current[:self.SIMILAR_STORED]
+        self.index.save_similar(neighbors, self.index.stats_generation)
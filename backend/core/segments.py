@@ -0,0 +1,164 @@
+import threading
+from backend.core.database import Database
+
+
+class SegmentMerger:
+    MERGE_FACTOR = 8
+    BASE_MERGE_RATIO = 0.1
+    BATCH_SIZE = 1000
+
+    def __init__(self, index):
+        self.index = index
+        self.codec = index.codec
+        self.base_merged = False
+
+    def merge_in_background(self):
+        thread = threading.Thread(target=self.merge_all, daemon=True)
+        thread.start()
+        return thread
+
+    def merge_all(self):
+        from backend.core.index import Index
+        merger = SegmentMerger(Index(self.index.data_path, self.index.db_path))
+        merges = 0
+        while merger.merge_once():
+            merges += 1
+        if merger.base_merged:
+            merger.index.export_flat()
+        return merges
+
+    def merge_once(self):
+        conn = Database.connect(self.index.db_path)
+        with conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            segments = self.find_merge(cur)
+            if not segments:
+                return False
+            self.merge(cur, segments)
+            return True
+
+    def find_merge(self, cur):
+        cur.execute('SELECT segment, docs FROM segments ORDER BY segment')
+        segments = cur.fetchall()
+        cur.execute('SELECT COUNT(*) FROM doc_meta WHERE segment = 0')
+        base_docs = cur.fetchone()[0]
+        cur.execute('SELECT COUNT(*) FROM tombstones WHERE segment = 0')
+        base_deleted = cur.fetchone()[0]
+        
+        changed = base_deleted + sum(docs for segment, docs in segments)
+        if changed >= max(self.MERGE_FACTOR, base_docs * self.BASE_MERGE_RATIO):
+            return [0] + [segment for segment, docs in segments]
+        run = []
+        run_tier = None
+        for segment, docs in segments:
+            tier = self.size_tier(docs)
+            if tier != run_tier:
+                run = []
+                run_tier = tier
+            run.append(segment)
+            if len(run) == self.MERGE_FACTOR:
+                return run
+        return None
+
+    def size_tier(self, docs):
+        tier = 0
+        while docs >= self.MERGE_FACTOR:
+            docs //= self.MERGE_FACTOR
+            tier += 1
+        return tier
+
+    def merge(self, cur, segments):
+        target = segments[0]
+        placeholders = ','.join('?' for _ in segments)
+        cur.execute(f'SELECT doc_id FROM tombstones WHERE segment IN ({placeholders})', segments)
+        deleted = {row[0] for row in cur.fetchall()}
+        
+        merged = {}
+        cur.execute(f'SELECT term, postings, positions FROM segment_postings WHERE segment IN ({placeholders}) '
+                    f'ORDER BY term, segment', segments)
+        for term, postings_blob, positions_blob in cur.fetchall():
+            self.append_part(merged.setdefault(term, [[], [], []]), postings_blob, positions_blob, deleted)
+        cur.execute(f'DELETE FROM segment_postings WHERE segment IN ({placeholders})', segments)
+        
+        if target == 0:
+            self.merge_into_base(cur, merged, deleted)
+            self.index.recompute_norms(cur)
+            self.index.increase_base_version(cur)
+            self.index.increase_generation(cur)
+            self.base_merged = True
+        else:
+            rows = []
+            for term, (doc_ids, tfs, deltas) in merged.items():
+                if doc_ids:
+                    positions = self.codec.pack_positions(deltas) if deltas is not None else None
+                    rows.append((target, term, self.codec.encode(doc_ids, tfs), positions))
+            cur.executemany('INSERT INTO segment_postings (segment, term, postings, positions) VALUES (?, ?, ?, ?)',
+                            rows)
+        
+        cur.execute(f'DELETE FROM segments WHERE segment IN ({placeholders})', segments)
+        cur.execute(f'UPDATE doc_meta SET segment = ? WHERE segment IN ({placeholders})', [target] + segments)
+        if target != 0:
+            cur.execute('SELECT COUNT(*) FROM doc_meta WHERE segment = ?', (target,))
+            cur.execute('INSERT INTO segments VALUES (?, ?)', (target, cur.fetchone()[0]))
+        cur.execute(f'DELETE FROM tombstones WHERE segment IN ({placeholders})', segments)
+
+    def merge_into_base(self, cur, merged, deleted):
+        last_term = ''
+        while True:
+            cur.execute('SELECT i.term, i.postings, p.positions FROM index_table i '
+                        'LEFT JOIN positions_table p ON p.term = i.term WHERE i.term > ? ORDER BY i.term LIMIT ?',
+                        (last_term, self.BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                return
+            last_term = rows[-1][0]
+            
+            postings_rows = []
+            positions_rows = []
+            for term, postings_blob, positions_blob in rows:
+                segment_part = merged.get(term)
+                if segment_part is None and (not postings_blob or not self.contains_deleted(postings_blob, deleted)):
+                    continue
+                part = [[], [], []]
+                if postings_blob:
+                    self.append_part(part, postings_blob, positions_blob, deleted)
+                if segment_part is not None:
+                    part[0].extend(segment_part[0])
+                    part[1].extend(segment_part[1])
+                    if part[2] is not None and segment_part[2] is not None:
+                        part[2].extend(segment_part[2])
+                    else:
+                        part[2] = None
+                doc_ids, tfs, deltas = part
+                postings_rows.append((self.codec.encode(doc_ids, tfs) if doc_ids else None, term))
+                if deltas is not None and doc_ids:
+                    positions_rows.append((term, self.codec.pack_positions(deltas)))
+            cur.executemany('UPDATE index_table SET postings = ? WHERE term = ?', postings_rows)
+            cur.executemany('INSERT OR REPLACE INTO positions_table VALUES (?, ?)', positions_rows)
+
+    def contains_deleted(self, postings_blob, deleted):
+        if not deleted:
+            return False
+        doc_ids, tfs = self.codec.decode(postings_blob)
+        return not deleted.isdisjoint(doc_ids)
+
+    def append_part(self, part, postings_blob, positions_blob, deleted):
+        part_ids, part_tfs = self.codec.decode(postings_blob)
+        part_deltas = self.codec.decode_positions(positions_blob) if positions_blob else None
+        if part_deltas is None:
+            part[2] = None
+        if deleted.isdisjoint(part_ids):
+            part[0].extend(part_ids)
+            part[1].extend(part_tfs)
+            if part[2] is not None:
+                part[2].extend(part_deltas)
+            return
+        offset = 0
+        for doc_id, tf in zip(part_ids, part_tfs):
+            if doc_id not in deleted:
+                part[0].append(doc_id)
+                part[1].append(tf)
+                if part[2] is not None:
+                    part[2].extend(part_deltas[offset:offset + tf])
+            offset += tf
@@ -36,24 +36,51 @@ class TextPreprocessor:
         'ся', 'сь', 'я', 'а', 'о', 'е', 'и', 'ы', 'у', 'ю'
     ]
 
+    NON_LETTERS = re.compile(r'[^a-zа-я\s]')
+    REPEATED_LETTERS = re.compile(r'(.)\1+')
+    STEM_CACHE_SIZE = 100000
+    instance = None
+
     def __init__(self):
-        self.endings_sorted = sorted(self.ENDINGS, key=len, reverse=True)
+        endings_by_length = {}
+        for ending in self.ENDINGS:
+            endings_by_length.setdefault(len(ending), set()).add(ending)
+        self.endings_by_length = sorted(endings_by_length.items(), reverse=True)
+        self.stem_cache = {}
+
+    @staticmethod
+    def get_instance():
+        if TextPreprocessor.instance is None:
+            TextPreprocessor.instance = TextPreprocessor()
+        return TextPreprocessor.instance
 
     def stem(self, word):
         if len(word) < 4:
             return word
-        w = re.sub(r'(.)\1+', r'\1', word)
-        for ending in self.endings_sorted:
-            if w.endswith(ending) and len(w) - len(ending) >= 3:
-                return w[:-len(ending)]
-        return w
+        stem = self.stem_cache.get(word)
+        if stem is not None:
+            return stem
+        w = self.REPEATED_LETTERS.sub(r'\1', word)
+        stem = w
+        for length, endings in self.endings_by_length:
+            if len(w) - length >= 3 and w[-length:] in endings:
+                stem = w[:-length]
+                break
+        if len(self.stem_cache) >= self.STEM_CACHE_SIZE:
+            self.stem_cache.clear()
+        self.stem_cache[word] = stem
+        return stem
 
     def preprocess(self, text):
         if not text:
             return ""
         t = text.lower().replace('ё', 'е')
-        t = re.sub(r'[^a-zа-я\s]', ' ', t)
-        t = re.sub(r'\s+', ' ', t).strip()
+        t = self.NON_LETTERS.sub(' ', t)
         words = [w for w in t.split() if len(w) > 2 and w not in self.STOP_WORDS]
         stems = [self.stem(w) for w in words]
         return ' '.join(s for s in stems if len(s) > 1)
+
+    def normalize_prefix(self, word):
+        w = word.lower().replace('ё', 'е')
+        w = self.NON_LETTERS.sub('', w)
+        return self.REPEATED_LETTERS.sub(r'\1', w)
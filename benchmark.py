@@ -0,0 +1,295 @@
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import sqlite3
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backend.core.text_preprocess import TextPreprocessor
+from backend.core.index import Index
+from backend.core.document_manager import Document
+from backend.core.search import SearchEngine
+
+
+class Benchmark:
+    def __init__(self):
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        self.docs_path = os.path.join(base_dir, 'data', 'documents')
+
+    def load_texts(self):
+        texts = []
+        for filename in sorted(os.listdir(self.docs_path)):
+            if filename.endswith('.txt'):
+                with open(os.path.join(self.docs_path, filename), 'r', encoding='utf-8') as f:
+                    texts.append(f.read())
+        return texts
+
+    def run_preprocess(self, repeats):
+        texts = self.load_texts()
+        token_count = 0
+        for text in texts:
+            token_count += len(text.split())
+        
+        preprocessor = TextPreprocessor()
+        cold_speed = self.measure_preprocess(preprocessor, texts, 1) * token_count
+        warm_speed = self.measure_preprocess(preprocessor, texts, repeats) * token_count
+        print(f"Токенов в корпусе: {token_count}")
+        print(f"Предобработка, холодный кэш: {cold_speed:,.0f} токенов/с")
+        print(f"Предобработка, прогретый кэш: {warm_speed:,.0f} токенов/с")
+
+    def measure_preprocess(self, preprocessor, texts, repeats):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for text in texts:
+                preprocessor.preprocess(text)
+        return repeats / (time.perf_counter() - start)
+
+    def make_corpus(self, path, size, doc_length=80):
+        words = sorted(set(' '.join(self.load_texts()).split()))
+        random.seed(size)
+        weights = [1 / rank for rank in range(1, len(words) + 1)]
+        random.shuffle(words)
+        os.makedirs(path, exist_ok=True)
+        for number in range(size):
+            text = ' '.join(random.choices(words, weights, k=doc_length))
+            with open(os.path.join(path, f'doc{number:06d}.txt'), 'w', encoding='utf-8') as f:
+                f.write(text)
+        return words
+
+    def make_index(self, size, positions=False):
+        temp_dir = tempfile.mkdtemp()
+        words = self.make_corpus(os.path.join(temp_dir, 'documents'), size)
+        index = Index(os.path.join(temp_dir, 'documents'), os.path.join(temp_dir, 'index.db'))
+        index.build_index(positions=positions)
+        return temp_dir, index, words
+
+    def make_queries(self, index, words, count=50):
+        preprocessor = TextPreprocessor.get_instance()
+        random.seed(count)
+        queries = []
+        for _ in range(count):
+            text = preprocessor.preprocess(' '.join(random.sample(words, 3)))
+            queries.append(index.create_vector(text))
+        return queries
+
+    def run_scoring(self, sizes, top_k):
+        for size in sizes:
+            temp_dir, index, words = self.make_index(size)
+            try:
+                engine = SearchEngine(index)
+                index.refresh_stats()
+                queries = self.make_queries(index, words)
+                
+                start = time.perf_counter()
+                engine.matrix.refresh()
+                matrix_build = time.perf_counter() - start
+                
+                start = time.perf_counter()
+                postings_ranked = [engine.rank_postings(q, engine.ranker.MIN_SCORE, top_k) for q in queries]
+                postings_time = (time.perf_counter() - start) / len(queries)
+                
+                start = time.perf_counter()
+                matrix_ranked = [engine.matrix.rank_many([q], engine.ranker.MIN_SCORE, top_k)[0] for q in queries]
+                matrix_time = (time.perf_counter() - start) / len(queries)
+                
+                start = time.perf_counter()
+                batch_ranked = engine.matrix.rank_many(queries, engine.ranker.MIN_SCORE, top_k)
+                batch_time = (time.perf_counter() - start) / len(queries)
+                
+                difference = 0
+                for expected, *others in zip(postings_ranked, matrix_ranked, batch_ranked):
+                    for ranked in others:
+                        scores = dict(ranked)
+                        for name, score in expected:
+                            difference = max(difference, abs(scores.get(name, 0) - score))
+                
+                print(f"Документов: {size}")
+                print(f"  Построение матрицы: {matrix_build * 1000:.0f} мс")
+                print(f"  Словарный подсчёт: {postings_time * 1000:.2f} мс/запрос")
+                print(f"  Матрица, по одному: {matrix_time * 1000:.2f} мс/запрос")
+                print(f"  Матрица, пакетом: {batch_time * 1000:.2f} мс/запрос")
+                print(f"  Максимальное расхождение оценок: {difference:.2e}")
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def run_phrases(self, sizes, top_k):
+        for size in sizes:
+            temp_dir, index, words = self.make_index(size)
+            db_path, documents_path = Document.DB_PATH, Document.DOCUMENTS_PATH
+            try:
+                self.register_documents(temp_dir, index)
+                start = time.perf_counter()
+                index.build_index(positions=False)
+                plain_build = time.perf_counter() - start
+                plain_size = self.measure_index_size(index)
+                plain_latency = self.measure_phrases(index, top_k)
+                
+                start = time.perf_counter()
+                index.build_index(positions=True)
+                positions_build = time.perf_counter() - start
+                postings_size, positions_size = self.measure_index_size(index)
+                phrase_latency = self.measure_phrases(index, top_k)
+                near_latency = self.measure_phrases(index, top_k, 'NEAR/3')
+                
+                print(f"Документов: {size}")
+                print(f"  Постинги: {plain_size[0] / 1024:.0f} КБ, позиции: {positions_size / 1024:.0f} КБ "
+                      f"(+{positions_size / postings_size * 100:.0f}%)")
+                print(f"  Построение: {plain_build:.1f} с без позиций, {positions_build:.1f} с с позициями")
+                print(f"  Фраза без позиций (только пересечение): {plain_latency * 1000:.2f} мс/запрос")
+                print(f"  Фраза с позициями: {phrase_latency * 1000:.2f} мс/запрос")
+                print(f"  NEAR/3 с позициями: {near_latency * 1000:.2f} мс/запрос")
+            finally:
+                Document.DB_PATH, Document.DOCUMENTS_PATH = db_path, documents_path
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def run_build(self, sizes, memory_budget):
+        for size in sizes:
+            temp_dir = tempfile.mkdtemp()
+            try:
+                self.make_corpus(os.path.join(temp_dir, 'documents'), size)
+                index = Index(os.path.join(temp_dir, 'documents'), os.path.join(temp_dir, 'index.db'))
+                memory_time, memory_peak = self.measure_build(index)
+                external_time, external_peak = self.measure_build(index, memory_budget)
+                print(f"Документов: {size}")
+                print(f"  В памяти: {memory_time:.1f} с, пик {memory_peak / 1024 / 1024:.1f} МБ")
+                print(f"  Слияние с диска (лимит {memory_budget} записей): {external_time:.1f} с, "
+                      f"пик {external_peak / 1024 / 1024:.1f} МБ")
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def measure_build(self, index, memory_budget=None):
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            index.build_index(memory_budget=memory_budget)
+            return time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def run_flat(self, sizes, repeats):
+        for size in sizes:
+            temp_dir, index, words = self.make_index(size)
+            try:
+                start = time.perf_counter()
+                index.export_flat()
+                export_time = time.perf_counter() - start
+                index.refresh_stats()
+                queries = [list(query) for query in self.make_queries(index, words)]
+                sqlite_time = self.measure_postings(index, queries, repeats, False)
+                flat_time = self.measure_postings(index, queries, repeats, True)
+                
+                start = time.perf_counter()
+                fresh = Index(index.data_path, index.db_path)
+                fresh.refresh_stats()
+                fresh.get_postings(queries[0])
+                open_time = time.perf_counter() - start
+                
+                print(f"Документов: {size}")
+                print(f"  Экспорт: {export_time:.1f} с, файл {os.path.getsize(index.flat_path) / 1024:.0f} КБ")
+                print(f"  Открытие индекса и первый запрос: {open_time * 1000:.0f} мс")
+                print(f"  Чтение постингов из SQLite: {sqlite_time * 1000:.3f} мс/запрос")
+                print(f"  Чтение постингов через mmap: {flat_time * 1000:.3f} мс/запрос")
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def measure_postings(self, index, queries, repeats, flat):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for query in queries:
+                index.get_postings(query, flat=flat)
+        return (time.perf_counter() - start) / (repeats * len(queries))
+
+    def measure_index_size(self, index):
+        conn = sqlite3.connect(index.db_path)
+        postings_size = conn.execute('SELECT COALESCE(SUM(LENGTH(postings)), 0) FROM index_table').fetchone()[0]
+        positions_size = conn.execute('SELECT COALESCE(SUM(LENGTH(positions)), 0) FROM positions_table').fetchone()[0]
+        conn.close()
+        return postings_size, positions_size
+
+    def measure_phrases(self, index, top_k, operator=None, count=50):
+        files = sorted(os.listdir(index.data_path))
+        random.seed(count)
+        queries = []
+        for filename in random.sample(files, min(count, len(files))):
+            with open(os.path.join(index.data_path, filename), 'r', encoding='utf-8') as f:
+                doc_words = f.read().split()
+            start = random.randrange(len(doc_words) - 1)
+            if operator:
+                queries.append(f'{doc_words[start]} {operator} {doc_words[start + 1]}')
+            else:
+                queries.append(f'"{doc_words[start]} {doc_words[start + 1]}"')
+        
+        engine = SearchEngine(index)
+        engine.search(queries[0], add_to_history=False, top_k=top_k)
+        start = time.perf_counter()
+        for query in queries:
+            engine.search(query, add_to_history=False, top_k=top_k)
+        return (time.perf_counter() - start) / len(queries)
+
+    def register_documents(self, temp_dir, index):
+        Document.DB_PATH = os.path.join(temp_dir, 'documents.db')
+        Document.DOCUMENTS_PATH = index.data_path
+        Document.init_storage()
+        rows = []
+        for number, filename in enumerate(sorted(os.listdir(index.data_path))):
+            rows.append((str(number), filename[:-4], os.path.join(index.data_path, filename)))
+        conn = sqlite3.connect(Document.DB_PATH)
+        with conn:
+            conn.executemany('INSERT INTO documents (id, name, file_path) VALUES (?, ?, ?)', rows)
+        conn.close()
+
+    def run_typing(self, size, top_k, budget):
+        temp_dir, index, words = self.make_index(size)
+        db_path, documents_path = Document.DB_PATH, Document.DOCUMENTS_PATH
+        try:
+            self.register_documents(temp_dir, index)
+            engine = SearchEngine(index)
+            random.seed(size)
+            weights = [1 / rank for rank in range(1, len(words) + 1)]
+            latencies = []
+            for _ in range(30):
+                phrase = ' '.join(random.choices(words, weights, k=3))
+                for end in range(2, len(phrase) + 1):
+                    start = time.perf_counter()
+                    engine.search(phrase[:end], add_to_history=False, top_k=top_k)
+                    latencies.append(time.perf_counter() - start)
+            
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            print(f"Документов: {size}, запросов: {len(latencies)}")
+            print(f"  p50: {p50:.2f} мс, p95: {p95:.2f} мс, максимум: {latencies[-1] * 1000:.2f} мс")
+            print(f"  Бюджет {budget:.0f} мс: {'выполнен' if p95 <= budget else 'превышен'}")
+        finally:
+            Document.DB_PATH, Document.DOCUMENTS_PATH = db_path, documents_path
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('target', choices=['preprocess', 'scoring', 'typing', 'phrases', 'build', 'flat'])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--size', type=int, default=50000)
+    parser.add_argument('--budget', type=float, default=50)
+    parser.add_argument('--memory-budget', type=int, default=200000)
+    args = parser.parse_args()
+    benchmark = Benchmark()
+    if args.target == 'preprocess':
+        benchmark.run_preprocess(args.repeats)
+    elif args.target == 'scoring':
+        benchmark.run_scoring(args.sizes, args.top_k)
+    elif args.target == 'phrases':
+        benchmark.run_phrases(args.sizes, args.top_k)
+    elif args.target == 'typing':
+        benchmark.run_typing(args.size, args.top_k, args.budget)
+    elif args.target == 'build':
+        benchmark.run_build(args.sizes, args.memory_budget)
+    elif args.target == 'flat':
+        benchmark.run_flat(args.sizes, args.repeats)
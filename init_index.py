@@ -2,15 +2,19 @@ import os
 import sys
 import uuid
 import re
+import argparse
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from backend.core.document_manager import Document
 from backend.core.index import Index
+from backend.core.ingest import BulkImporter
+from backend.core.search import SearchEngine
+from backend.core.segments import SegmentMerger
 from backend.core.text_preprocess import TextPreprocessor
 
 
-def initialize():
+def initialize(workers=1, positions=None, stream=False, budget=None, memory_budget=None, rebuild=False):
     print("Инициализация системы...")
     Document.init_storage()
     print("База данных готова")
@@ -22,26 +26,49 @@ def initialize():
         print(f"Папка с документами не найдена: {docs_path}")
         return True
     
+    if stream:
+        importer = BulkImporter(postings_budget=budget, positions=positions)
+        added, total = importer.run()
+        importer.index.export_flat()
+        similar = SearchEngine().precompute_similar_documents()
+        print(f"Похожие документы рассчитаны: {similar}")
+        print(f"Готово. Добавлено: {added}, всего файлов: {total}")
+        return True
+    
     files = [f for f in os.listdir(docs_path) if f.endswith('.txt')]
     added = 0
     
     index = Index()
-    preprocessor = TextPreprocessor()
+    preprocessor = TextPreprocessor.get_instance()
+    
+    if rebuild:
+        index.build_index(workers=workers, positions=positions, memory_budget=memory_budget)
+        index.export_flat()
+        updated = []
+    else:
+        new, updated, removed = index.sync_index(workers=workers, positions=positions, memory_budget=memory_budget)
+        for doc_name in removed:
+            doc = Document.get_by_name(doc_name)
+            if doc:
+                doc.delete_from_db()
+        SegmentMerger(index).merge_all()
+        print(f"Индекс обновлён. Новых: {len(new)}, изменённых: {len(updated)}, удалённых: {len(removed)}")
     
     for filename in files:
         doc_name = filename[:-4]
         file_path = os.path.join(docs_path, filename)
         
+        doc = Document.get_by_name(doc_name)
+        if doc and doc_name not in updated:
+            print(f"Пропущен: {doc_name}")
+            continue
+        
         with open(file_path, 'r', encoding='utf-8') as f:
             text = f.read()
         
         if not text.strip():
             continue
         
-        if Document.get_by_name(doc_name):
-            print(f"Пропущен: {doc_name}")
-            continue
-        
         processed = preprocessor.preprocess(text)
         keywords_stems = index.extract_keywords(processed, top_n=7)
         
@@ -53,6 +80,12 @@ def initialize():
                     keywords_original.append(w)
                     break
         
+        if doc:
+            doc.path = file_path
+            doc.save_to_db(keywords_original)
+            print(f"Обновлён: {doc_name}")
+            continue
+        
         doc_id = str(uuid.uuid4())
         doc = Document(doc_id, doc_name, file_path)
         doc.save_to_db(keywords_original)
@@ -60,11 +93,21 @@ def initialize():
         print(f"Добавлен: {doc_name}")
         added += 1
     
-    index.build_index()
+    similar = SearchEngine().precompute_similar_documents(only_missing=not rebuild)
+    print(f"Похожие документы рассчитаны: {similar}")
     print(f"Готово. Добавлено: {added}, всего файлов: {len(files)}")
     return True
 
 
 if __name__ == '__main__':
-    ok = initialize()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--positions', action='store_true', default=None)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--budget', type=int, default=None)
+    parser.add_argument('--memory-budget', type=int, default=None)
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args()
+    ok = initialize(workers=args.workers, positions=args.positions, stream=args.stream, budget=args.budget,
+                    memory_budget=args.memory_budget, rebuild=args.rebuild)
     sys.exit(0 if ok else 1)
\ No newline at end of file
@@ -1,22 +1,38 @@
 import sys
 import os
 from PyQt5 import QtWidgets
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThreadPool, QTimer, QStringListModel
 from PyQt5.QtWidgets import QApplication, QMessageBox, QListWidgetItem
 
 from backend.core.document_manager import Document
 from backend.core.search import SearchEngine
 from text_reader_form import TextReaderForm
 from backend.core.recommender import Recommender
+from workers import Worker
 
 class MainWindow(QtWidgets.QMainWindow):
+    RESULTS_LIMIT = 50
+    LIVE_RESULTS_LIMIT = 10
+    LIVE_SEARCH_DELAY = 250
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Поисковая система")
         self.resize(1100, 700)
         self.setMinimumSize(900, 600)
         
+        self.engine_pool = QThreadPool()
+        self.engine_pool.setMaxThreadCount(1)
+        self.index_pool = QThreadPool()
+        self.index_pool.setMaxThreadCount(1)
+        self.active_workers = set()
+        self.search_worker = None
+        self.similar_worker = None
+        self.recommend_worker = None
+        self.complete_worker = None
+        
         self.engine = SearchEngine()
+        self.engine.precompute_similar_in_background(only_missing=True)
         self.documents = Document.get_all()
             
         self.current_doc_id = None
@@ -47,6 +63,11 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.create_pages()
         
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setMaximumWidth(250)
+        self.progress_bar.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        
         self.go_to(self.pages["home"])
 
     def create_nav_bar(self):
@@ -177,6 +198,11 @@ class MainWindow(QtWidgets.QMainWindow):
         self.search_input.setMinimumHeight(50)
         self.search_input.setStyleSheet(self.input_style())
         layout.addWidget(self.search_input)
+        
+        self.completion_model = QStringListModel()
+        completer = QtWidgets.QCompleter(self.completion_model, self)
+        completer.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        self.search_input.setCompleter(completer)
 
         self.filter_input = QtWidgets.QLineEdit()
         self.filter_input.setPlaceholderText("Фильтр (теги через запятую)")
@@ -186,7 +212,18 @@ class MainWindow(QtWidgets.QMainWindow):
         
         btn_search = self.create_button("Найти", self.do_search)
         layout.addWidget(btn_search)
-        layout.addStretch()
+        
+        self.live_results_list = QtWidgets.QListWidget()
+        self.live_results_list.setStyleSheet(self.list_style())
+        self.live_results_list.itemClicked.connect(self.open_doc)
+        layout.addWidget(self.live_results_list)
+        
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(self.LIVE_SEARCH_DELAY)
+        self.live_timer.timeout.connect(self.live_search)
+        self.search_input.textChanged.connect(lambda text: self.live_timer.start())
+        self.filter_input.textChanged.connect(lambda text: self.live_timer.start())
         return page
 
     def page_results(self):
@@ -205,7 +242,7 @@ class MainWindow(QtWidgets.QMainWindow):
         return page
 
     def page_view(self):
-        self.reader_form = TextReaderForm()
+        self.reader_form = TextReaderForm(self.start_worker, self.index_pool)
         self.reader_form.btn_delete.clicked.connect(self.delete_current_doc)
         self.reader_form.similar_list.itemClicked.connect(self.open_similar_doc)
         self.reader_form.setStyleSheet("background: transparent;")
@@ -312,16 +349,43 @@ class MainWindow(QtWidgets.QMainWindow):
                 self.doc_history = []
         self.btn_back.setEnabled(self.current_idx > 0)
 
+    def start_worker(self, pool, func, *args, on_finished=None, on_failed=None, with_progress=False, **kwargs):
+        worker = Worker(func, *args, **kwargs)
+        if with_progress:
+            worker.kwargs['progress'] = worker.report_progress
+            worker.signals.progress.connect(self.show_progress)
+        if on_finished:
+            worker.signals.finished.connect(on_finished)
+        if on_failed:
+            worker.signals.failed.connect(on_failed)
+        worker.signals.done.connect(self.release_worker)
+        self.active_workers.add(worker)
+        pool.start(worker)
+        return worker
+
+    def release_worker(self, worker):
+        self.active_workers.discard(worker)
+        if 'progress' in worker.kwargs:
+            self.progress_bar.hide()
+
+    def show_progress(self, done, total):
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(done)
+        self.progress_bar.show()
+
     def update_recommendations(self):
         self.recommend_list.clear()
-        try:
-            recs = self.recommender.get_document_recommendations(top_n=5)
-            for name in recs:
-                item = QtWidgets.QListWidgetItem(name)
-                item.setData(Qt.UserRole, name)
-                self.recommend_list.addItem(item)
-        except Exception:
-            pass
+        if self.recommend_worker:
+            self.recommend_worker.cancel()
+        self.recommend_worker = self.start_worker(self.engine_pool, self.recommender.get_document_recommendations,
+                                                  top_n=5, on_finished=self.show_recommendations)
+
+    def show_recommendations(self, recs):
+        self.recommend_list.clear()
+        for name in recs:
+            item = QtWidgets.QListWidgetItem(name)
+            item.setData(Qt.UserRole, name)
+            self.recommend_list.addItem(item)
 
     def do_search(self):
         query = self.search_input.text().strip()
@@ -340,52 +404,95 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             filters = None
         
-        try:
-            results = self.engine.search(query, filters)
-            self.results_list.clear()
-            
-            if not results:
-                QMessageBox.information(self, "Результаты", "Документы не найдены.")
-                return
-            
-            print(f"[DEBUG] Результаты поиска: запрос='{query}', найдено={len(results)}")
-            for r in results:
-                try:
-                    print(f"[DEBUG] точность={r.score:.4f} документ='{r.document.name}'")
-                except Exception:
-                    pass
-                item = QtWidgets.QListWidgetItem(r.document.name)
-                item.setData(Qt.UserRole, r.document.name)
-                self.results_list.addItem(item)
-            
-            self.go_to(self.pages["results"])
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка при поиске: {str(e)}")
+        self.live_timer.stop()
+        if self.search_worker:
+            self.search_worker.cancel()
+        self.search_worker = self.start_worker(self.engine_pool, self.engine.search, query, filters,
+                                               top_k=self.RESULTS_LIMIT, on_finished=self.show_search_results,
+                                               on_failed=self.show_search_error)
+
+    def live_search(self):
+        query = self.search_input.text().strip()
+        if self.search_worker:
+            self.search_worker.cancel()
+        if self.complete_worker:
+            self.complete_worker.cancel()
+        if not query:
+            self.live_results_list.clear()
+            return
+        
+        self.complete_worker = self.start_worker(self.engine_pool, self.engine.complete, self.search_input.text(),
+                                                 on_finished=self.show_completions)
+        
+        filters = [f.strip() for f in self.filter_input.text().split(',') if f.strip()] or None
+        self.search_worker = self.start_worker(self.engine_pool, self.engine.search, query, filters,
+                                               add_to_history=False, top_k=self.LIVE_RESULTS_LIMIT,
+                                               on_finished=self.show_live_results)
+
+    def show_completions(self, completions):
+        self.completion_model.setStringList(completions)
+        if completions and self.search_input.hasFocus():
+            self.search_input.completer().complete()
+
+    def show_live_results(self, results):
+        self.live_results_list.clear()
+        for r in results:
+            item = QtWidgets.QListWidgetItem(r.document.name)
+            item.setData(Qt.UserRole, r.document.name)
+            self.live_results_list.addItem(item)
+
+    def show_search_results(self, results):
+        self.results_list.clear()
+        
+        if not results:
+            QMessageBox.information(self, "Результаты", "Документы не найдены.")
+            return
+        
+        print(f"[DEBUG] Результаты поиска: запрос='{self.search_input.text().strip()}', найдено={len(results)}")
+        for r in results:
+            try:
+                print(f"[DEBUG] точность={r.score:.4f} документ='{r.document.name}'")
+            except Exception:
+                pass
+            item = QtWidgets.QListWidgetItem(r.document.name)
+            item.setData(Qt.UserRole, r.document.name)
+            self.results_list.addItem(item)
+        
+        self.go_to(self.pages["results"])
+
+    def show_search_error(self, e):
+        QMessageBox.critical(self, "Ошибка", f"Ошибка при поиске: {str(e)}")
 
     def open_doc(self, item, add_to_history=True):
         doc_id = item.data(Qt.UserRole)
         try:
-            self.documents = Document.get_all()
+            doc = Document.get_by_name(doc_id) or Document.get_by_id(doc_id)
         except Exception:
-            pass
-        doc = next((d for d in self.documents if d.name == doc_id or getattr(d, 'id', None) == doc_id), None)
+            doc = None
         if not doc:
             return
         
         self.current_doc_id = doc.name
         self.reader_form.set_document(doc)
         
-        try:
-            self.reader_form.similar_list.clear()
-            for res in self.engine.get_similar_documents(doc.name):
-                it = QtWidgets.QListWidgetItem(res.document.name)
-                it.setData(Qt.UserRole, res.document.name)
-                self.reader_form.similar_list.addItem(it)
-        except Exception as e:
-            print(f"Ошибка при загрузке похожих документов: {e}")
+        self.reader_form.similar_list.clear()
+        if self.similar_worker:
+            self.similar_worker.cancel()
+        self.similar_worker = self.start_worker(self.engine_pool, self.engine.get_similar_documents, doc.name,
+                                                on_finished=self.show_similar_docs, on_failed=self.show_similar_error)
         
         self.go_to(self.pages["view"], add=True)
 
+    def show_similar_docs(self, results):
+        self.reader_form.similar_list.clear()
+        for res in results:
+            it = QtWidgets.QListWidgetItem(res.document.name)
+            it.setData(Qt.UserRole, res.document.name)
+            self.reader_form.similar_list.addItem(it)
+
+    def show_similar_error(self, e):
+        print(f"Ошибка при загрузке похожих документов: {e}")
+
     def open_similar_doc(self, item):
         self.open_doc(item, add_to_history=True)
 
@@ -401,13 +508,19 @@ class MainWindow(QtWidgets.QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
-            try:
-                Document.delete_document(self.current_doc_id)
-                self.documents = Document.get_all()
-                QMessageBox.information(self, "Успех", "Документ удален.")
-                self.go_to(self.pages["all_docs"])
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось удалить документ: {str(e)}")
+            self.reader_form.btn_delete.setEnabled(False)
+            self.start_worker(self.index_pool, Document.delete_document, self.current_doc_id,
+                              on_finished=self.doc_deleted, on_failed=self.delete_failed)
+
+    def doc_deleted(self, result):
+        self.reader_form.btn_delete.setEnabled(True)
+        self.documents = Document.get_all()
+        QMessageBox.information(self, "Успех", "Документ удален.")
+        self.go_to(self.pages["all_docs"])
+
+    def delete_failed(self, e):
+        self.reader_form.btn_delete.setEnabled(True)
+        QMessageBox.critical(self, "Ошибка", f"Не удалось удалить документ: {str(e)}")
 
     def save_new_doc(self):
         name = self.add_title.text().strip()
@@ -427,16 +540,23 @@ class MainWindow(QtWidgets.QMainWindow):
             QMessageBox.warning(self, "Ошибка", "Название содержит недопустимые символы: < > : \" / \\ | ? *")
             return
         
+        self.start_worker(self.index_pool, Document.create_new, name, text, on_finished=self.new_doc_saved,
+                          on_failed=self.new_doc_failed, with_progress=True)
+
+    def new_doc_saved(self, doc):
         try:
-            Document.create_new(name, text)
             self.documents = Document.get_all()
-            self.add_title.clear()
-            self.add_content.clear()
-            QMessageBox.information(self, "Успех", "Документ успешно создан.")
-            self.go_to(self.pages["home"])
-        except FileExistsError:
-            QMessageBox.warning(self, "Ошибка", f"Документ с именем '{name}' уже существует.")
-        except Exception as e:
+        except Exception:
+            self.documents = []
+        self.add_title.clear()
+        self.add_content.clear()
+        QMessageBox.information(self, "Успех", f"Документ '{doc.name}' успешно создан.")
+        self.go_to(self.pages["home"])
+
+    def new_doc_failed(self, e):
+        if isinstance(e, FileExistsError):
+            QMessageBox.warning(self, "Ошибка", f"{str(e)}.")
+        else:
             QMessageBox.critical(self, "Ошибка", f"Не удалось создать документ: {str(e)}")
 
     def import_text_from_file(self):
@@ -487,10 +607,6 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def filter_docs(self, text):
         self.all_docs_list.clear()
-        try:
-            self.documents = Document.get_all()
-        except Exception:
-            self.documents = self.documents if hasattr(self, "documents") else []
         for d in self.documents:
             if text.lower() in d.name.lower():
                 item = QtWidgets.QListWidgetItem(d.name)
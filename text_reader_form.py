@@ -1,10 +1,12 @@
 from PyQt5 import QtWidgets
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThreadPool
 from PyQt5.QtWidgets import QMessageBox
 
 class TextReaderForm(QtWidgets.QWidget):
-    def __init__(self):
+    def __init__(self, start_worker, pool=None):
         super().__init__()
+        self.start_worker = start_worker
+        self.pool = pool or QThreadPool.globalInstance()
         self.document = None
         self.is_edit_mode = False
         self.title = None
@@ -176,15 +178,21 @@ class TextReaderForm(QtWidgets.QWidget):
         if not txt:
             QMessageBox.warning(self, "Ошибка", "Текст не может быть пустым.")
             return
-        try:
-            from backend.core.document_manager import Document
-            doc_id = getattr(self.document, 'id', self.document.name)
-            Document.update_text(doc_id, txt)
-            QMessageBox.information(self, "Готово", "Документ сохранён.")
-            self.update_keywords(txt)
-            self.toggle_edit()
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить: {str(e)}")
+        from backend.core.document_manager import Document
+        doc_id = getattr(self.document, 'id', self.document.name)
+        self.btn_edit.setEnabled(False)
+        self.start_worker(self.pool, Document.update_text, doc_id, txt, on_finished=lambda result: self.saved(txt),
+                          on_failed=self.save_failed, with_progress=True)
+
+    def saved(self, txt):
+        self.btn_edit.setEnabled(True)
+        QMessageBox.information(self, "Готово", "Документ сохранён.")
+        self.update_keywords(txt)
+        self.toggle_edit()
+
+    def save_failed(self, e):
+        self.btn_edit.setEnabled(True)
+        QMessageBox.critical(self, "Ошибка", f"Не удалось сохранить: {str(e)}")
 
     def update_keywords(self, text: str):
         if not self.keywords_label:
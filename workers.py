@@ -0,0 +1,37 @@
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    progress = pyqtSignal(int, int)
+    done = pyqtSignal(object)
+
+
+class Worker(QRunnable):
+    def __init__(self, func, *args, **kwargs):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.cancelled = False
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report_progress(self, done, total):
+        if not self.cancelled:
+            self.signals.progress.emit(done, total)
+
+    def run(self):
+        if not self.cancelled:
+            try:
+                result = self.func(*self.args, **self.kwargs)
+                if not self.cancelled:
+                    self.signals.finished.emit(result)
+            except Exception as e:
+                if not self.cancelled:
+                    self.signals.failed.emit(e)
+        self.signals.done.emit(self)